@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+import metrics
+from database.conn import AsyncSessionLocal, SessionLocal
+from database.models import AskedQuestion
+
+load_dotenv()
+
+# "memory": per-process LRU (single worker); "sql": the asked_questions table (shared by every worker)
+CONVERSATION_STATE_BACKEND = os.getenv("CONVERSATION_STATE_BACKEND", "memory").lower()
+# Conversations kept by the memory backend, and how long an idle one lives in either backend
+CONVERSATION_STATE_MAX = int(os.getenv("CONVERSATION_STATE_MAX", "10000"))
+CONVERSATION_STATE_TTL_S = float(os.getenv("CONVERSATION_STATE_TTL_S", str(6 * 60 * 60)))
+
+
+class MemoryConversationState:
+    """Asked questions per conversation in an LRU bounded by entry count, with idle entries expiring after the TTL."""
+
+    def __init__(self, max_conversations=CONVERSATION_STATE_MAX, ttl_s=CONVERSATION_STATE_TTL_S):
+        self.max_conversations = max_conversations
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # conversation_id -> (asked questions, last access)
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._entries:
+            conversation_id, (_, last_access) = next(iter(self._entries.items()))
+            if now - last_access < self.ttl_s:
+                break
+            del self._entries[conversation_id]
+            metrics.incr("conversation_state.expired")
+
+    def _touch(self, conversation_id):
+        now = time.monotonic()
+        self._expire(now)
+        asked = self._entries.pop(conversation_id, (set(), now))[0]
+        self._entries[conversation_id] = (asked, now)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+            metrics.incr("conversation_state.evicted")
+        return asked
+
+    async def asked_questions(self, conversation_id):
+        with self._lock:
+            return set(self._touch(conversation_id))
+
+    async def mark_asked(self, conversation_id, question):
+        with self._lock:
+            self._touch(conversation_id).add(question)
+
+    async def clear(self, conversation_id):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def purge_expired(self):
+        with self._lock:
+            before = len(self._entries)
+            self._expire(time.monotonic())
+            return before - len(self._entries)
+
+    def stats(self):
+        return {"backend": "memory", "conversations": len(self._entries)}
+
+
+class SQLConversationState:
+    """
+    Asked questions in the asked_questions table, so every worker sees the same state. The per-turn
+    methods use the async engine so they don't block the event loop; purge_expired runs at startup.
+    """
+
+    def __init__(self, ttl_s=CONVERSATION_STATE_TTL_S):
+        self.ttl_s = ttl_s
+
+    async def asked_questions(self, conversation_id):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(AskedQuestion.question).where(AskedQuestion.conversation_id == conversation_id))
+            return set(result.scalars().all())
+
+    async def mark_asked(self, conversation_id, question):
+        async with AsyncSessionLocal() as db:
+            db.add(AskedQuestion(conversation_id=conversation_id, question=question))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Already recorded (possibly by another worker)
+                await db.rollback()
+
+    async def clear(self, conversation_id):
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(AskedQuestion).where(AskedQuestion.conversation_id == conversation_id))
+            await db.commit()
+
+    def purge_expired(self):
+        """Deletes state of conversations abandoned before completing. Returns the number of rows removed."""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now() - timedelta(seconds=self.ttl_s)
+            idle = select(AskedQuestion.conversation_id).group_by(AskedQuestion.conversation_id)\
+                .having(func.max(AskedQuestion.created_at) < cutoff)
+            removed = db.query(AskedQuestion).filter(AskedQuestion.conversation_id.in_(idle)).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def stats(self):
+        return {"backend": "sql"}
+
+
+_store = None
+
+
+def get_conversation_state():
+    global _store
+    if _store is None:
+        _store = SQLConversationState() if CONVERSATION_STATE_BACKEND == "sql" else MemoryConversationState()
+    return _store
@@ -1,7 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from dotenv import load_dotenv
 import os
+import metrics
 
 load_dotenv()
 
@@ -10,10 +14,47 @@ load_dotenv()
 # USER = os.getenv("DATABASE_USER")   
 # PASSWORD = os.getenv("DATABASE_PASSWORD")
 
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection (db.pool_wait)."""
+
+    def _do_get(self):
+        with metrics.timed("db.pool_wait"):
+            return super()._do_get()
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Async engine counterpart of TimedQueuePool (db.async_pool_wait)."""
+
+    def _do_get(self):
+        with metrics.timed("db.async_pool_wait"):
+            return super()._do_get()
+
+
+def async_database_url(url):
+    """
+    The asyncpg form of a psycopg2 DATABASE_URL. asyncpg takes `ssl` as a connect argument instead
+    of the `sslmode` query parameter, so it is returned separately; libpq-only parameters are dropped.
+    """
+    url = make_url(url)
+    sslmode = url.query.get("sslmode")
+    url = url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode", "channel_binding"])
+    return url, ({"ssl": sslmode} if sslmode else {})
+
+
 # Database connection string
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL, pool_size=20, max_overflow=0)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool, pool_size=20, max_overflow=0)
+# Objects stay usable after a commit, so a request can end its read transaction before a slow
+# LLM call and keep working with what it loaded (see release_connection)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+
+# Async engine for the conversation endpoints: queries await instead of blocking the event loop,
+# so one worker overlaps DB and LLM I/O across many employees. Same database, separate pool.
+ASYNC_DATABASE_URL, _async_connect_args = async_database_url(os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool, pool_size=20, max_overflow=0,
+                                   connect_args=_async_connect_args)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 print("✅ Connected to PostgreSQL")
 
 
@@ -23,3 +64,33 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def release_connection(db):
+    """
+    Ends the session's current transaction so its connection goes back to the pool.
+    Call it before network I/O (LLM calls, uploads); the next query checks a connection out again.
+    """
+    db.commit()
+
+
+async def arelease_connection(db):
+    """release_connection for an AsyncSession."""
+    await db.commit()
+
+
+def _pool_stats(pool):
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+def pool_stats():
+    return {**_pool_stats(engine.pool), "async": _pool_stats(async_engine.pool)}
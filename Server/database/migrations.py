@@ -0,0 +1,68 @@
+from sqlalchemy import text
+
+# Idempotent schema changes for tables that already exist (create_all only creates missing tables).
+# Each statement must be safe to run on every startup.
+MIGRATIONS = [
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS question_set JSON",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS conversation_id INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_messages_conversation_id_id ON messages (conversation_id, id)",
+    # NOT VALID skips checking existing rows, so startup doesn't scan messages; new writes are checked
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'messages_conversation_id_fkey') THEN
+            ALTER TABLE messages ADD CONSTRAINT messages_conversation_id_fkey
+                FOREIGN KEY (conversation_id) REFERENCES conversations (id) NOT VALID;
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_conversations_employee_id_date_time_id ON conversations (employee_id, date, time, id)",
+]
+
+# Data migrations that must run exactly once, recorded by name in schema_migrations after they succeed.
+ONE_OFF_MIGRATIONS = [
+    (
+        "backfill_messages_conversation_id",
+        """
+        UPDATE messages AS m SET conversation_id = c.id
+        FROM conversations AS c, json_array_elements_text(c.message_ids) AS linked(message_id)
+        WHERE m.id = linked.message_id::integer AND m.conversation_id IS NULL
+        """,
+    ),
+    (
+        # The summary cache moved from master_table columns to user_summaries (created by create_all)
+        "move_user_summaries_out_of_master_table",
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'master_table' AND column_name = 'user_summary') THEN
+                INSERT INTO user_summaries (employee_id, summary, fingerprint, embedding, updated_at)
+                SELECT employee_id, user_summary, user_summary_fingerprint, user_summary_embedding, now()
+                FROM master_table
+                WHERE user_summary <> '' AND user_summary_embedding IS NOT NULL
+                ON CONFLICT (employee_id) DO NOTHING;
+                ALTER TABLE master_table DROP COLUMN user_summary,
+                    DROP COLUMN user_summary_fingerprint,
+                    DROP COLUMN user_summary_embedding;
+            END IF;
+        END $$
+        """,
+    ),
+]
+
+
+def run_migrations(engine):
+    """Applies every migration in order inside one transaction."""
+    with engine.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR PRIMARY KEY, applied_at TIMESTAMP DEFAULT now())"))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+        for name, statement in ONE_OFF_MIGRATIONS:
+            if name in applied:
+                continue
+            conn.execute(text(statement))
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name) ON CONFLICT DO NOTHING"), {"name": name})
+            print(f"✅ Applied one-off migration {name}")
+    print("✅ Database migrations applied")
@@ -1,5 +1,5 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Boolean, Text, JSON, Float,Date, Time
+from sqlalchemy import Column, Integer, String, Boolean, Text, JSON, Float,Date, Time, DateTime, UniqueConstraint, Index, ForeignKey
 from sqlalchemy.ext.mutable import MutableList, MutableDict
 from datetime import datetime
 
@@ -46,20 +46,25 @@ class HRUser(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    # An employee's history is paged newest first on (date, time, id)
+    __table_args__ = (Index("ix_conversations_employee_id_date_time_id", "employee_id", "date", "time", "id"),)
     
     id = Column(Integer, primary_key=True, index=True)  # Conversation ID.
     employee_id = Column(String, nullable=False)         # Reference to Employee.id.
     employee_name = Column(String, nullable=False)
-    message_ids = Column(MutableList.as_mutable(JSON), default=[])  # List of message IDs.
+    message_ids = Column(MutableList.as_mutable(JSON), default=[])  # Legacy list of message IDs; messages now point here via Message.conversation_id.
     date= Column(Date, nullable=False, default=lambda: datetime.now().date())
     time= Column(Time, nullable=False, default=lambda: datetime.now().time())
     report = Column(Text, nullable = True)
+    question_set = Column(JSON, nullable=True)  # Relevant questions, computed once on the first turn.
 
 class Message(Base):
     __tablename__ = "messages"
+    # Transcript reads are a single range scan ordered by id
+    __table_args__ = (Index("ix_messages_conversation_id_id", "conversation_id", "id"),)
     
     id = Column(Integer, primary_key=True, index=True)
-    # conv_id = Column(Integer, nullable=False)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True)
     content = Column(Text, nullable=False)
     sender_type = Column(String, nullable=False)  # "assistant" or "user"
     #data and time should automatically be added when a message is sent
@@ -68,6 +73,31 @@ class Message(Base):
     time = Column(Time, nullable=False, default=lambda: datetime.now().time())
 
 
+class UserSummary(Base):
+    """
+    Cached LLM summary of an employee's shap_nature, used for question retrieval. Kept out of
+    master_table so endpoints that return Master rows don't expose it or its embedding.
+    """
+    __tablename__ = "user_summaries"
+
+    employee_id = Column(String, primary_key=True)                      # Reference to Master.employee_id.
+    summary = Column(Text, nullable=False)
+    fingerprint = Column(String, nullable=False)                        # Hash of the shap_nature the summary was built from.
+    embedding = Column(JSON, nullable=False)                            # Embedding of summary.
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+
+class AskedQuestion(Base):
+    """Questions already asked in a conversation (used by the "sql" conversation-state backend)."""
+    __tablename__ = "asked_questions"
+    __table_args__ = (UniqueConstraint("conversation_id", "question"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, nullable=False, index=True)  # Reference to Conversation.id.
+    question = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
     
 # class Message(Base):
 #     __tablename__ = "messages"
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dotenv import load_dotenv
+import metrics
+from embedding_cache import make_key
+from embeddings import get_embedding_service
+
+load_dotenv()
+
+# How long the worker waits for more requests after the first one arrives
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+# Upper bound on the number of texts in one forward pass
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent embed_query/embed_documents calls for a few milliseconds and runs them
+    as one batched forward pass on a dedicated thread. Cache hits are answered immediately
+    without entering the queue.
+    """
+
+    def __init__(self, service, max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS, max_batch_size=EMBEDDING_BATCH_MAX_SIZE):
+        self.service = service
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, texts):
+        """Returns a Future resolving to one float32 vector per text."""
+        texts = list(texts)
+        cache = self.service.cache
+        keys = [make_key(self.service.model_name, text) for text in texts] if cache is not None else None
+        vectors = [cache.get(key) for key in keys] if cache is not None else [None] * len(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        result = Future()
+        if not missing:
+            result.set_result(vectors)
+            return result
+
+        pending = Future()
+
+        def _fill(done):
+            try:
+                computed = done.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            for i, vector in zip(missing, computed):
+                vectors[i] = cache.put(keys[i], vector) if cache is not None else vector
+            result.set_result(vectors)
+
+        pending.add_done_callback(_fill)
+        self.start()
+        self._queue.put(([texts[i] for i in missing], pending, time.perf_counter()))
+        return result
+
+    def embed_documents(self, texts):
+        return self.submit(texts).result()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return await asyncio.wrap_future(self.submit(texts))
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def _collect(self):
+        """Blocks for the first request, then gathers more until max_wait or max_batch_size."""
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for item in batch for text in item[0]]
+            now = time.perf_counter()
+            for _, _, enqueued in batch:
+                metrics.observe("embeddings.batch_queue_wait", now - enqueued)
+            metrics.incr("embeddings.batches")
+            metrics.incr("embeddings.batched_texts", len(texts))
+            metrics.incr("embeddings.batched_requests", len(batch))
+            try:
+                # One forward pass for every waiting caller
+                vectors = self.service._embed_documents(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher():
+    """Process-wide batching front-end over the shared embedding service."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher(get_embedding_service())
+    return _batcher
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from langchain_huggingface import HuggingFaceEmbeddings
+import metrics
+from embedding_cache import get_embedding_cache
+
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+class EmbeddingService:
+    """
+    Process-wide wrapper around the sentence-transformer model.
+    The model is loaded once (at startup via `warm`, or lazily on first use behind a lock)
+    and shared by every request. When a cache is attached, embeddings are served from it and
+    returned as float32 numpy arrays.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, cache=None):
+        self.model_name = model_name
+        self.cache = cache
+        self.load_time = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Returns the loaded HuggingFaceEmbeddings instance, loading it if needed."""
+        if self._model is None:
+            with self._lock:
+                # Another thread may have finished loading while we waited on the lock
+                if self._model is None:
+                    start = time.perf_counter()
+                    model = HuggingFaceEmbeddings(
+                        model_name=self.model_name, encode_kwargs={"normalize_embeddings": True})
+                    # One forward pass so the first real request doesn't pay the warm-up
+                    model.embed_query("warm up")
+                    self.load_time = time.perf_counter() - start
+                    metrics.observe("embeddings.load", self.load_time)
+                    print(f"✅ Loaded embedding model {self.model_name} in {self.load_time:.2f}s")
+                    self._model = model
+        return self._model
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    def warm(self):
+        """Loads the model ahead of the first request."""
+        return self.model
+
+    def _embed_query(self, text):
+        model = self.model
+        with metrics.timed("embeddings.embed_query"):
+            return model.embed_query(text)
+
+    def _embed_documents(self, texts):
+        model = self.model
+        with metrics.timed("embeddings.embed_documents"):
+            return model.embed_documents(list(texts))
+
+    def embed_query(self, text):
+        if self.cache is None:
+            return self._embed_query(text)
+        return self.cache.get_or_compute(self.model_name, text, self._embed_query)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if self.cache is None:
+            return self._embed_documents(texts)
+        return self.cache.get_many_or_compute(self.model_name, texts, self._embed_documents)
+
+    def stats(self):
+        timers = metrics.snapshot()["timers"]
+        return {
+            "model_name": self.model_name,
+            "loaded": self.is_loaded,
+            "load_time_s": round(self.load_time, 3) if self.load_time is not None else None,
+            "embed_query": timers.get("embeddings.embed_query"),
+            "embed_documents": timers.get("embeddings.embed_documents"),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+embedding_service = EmbeddingService(cache=get_embedding_cache())
+
+
+def get_embedding_service():
+    return embedding_service
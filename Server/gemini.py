@@ -1,45 +1,204 @@
 import os
-import requests
 import json
+import threading
+import time
+import httpx
 from dotenv import load_dotenv
-from fastapi import HTTPException
+import metrics
 
 # Load environment variables
 load_dotenv()
 
 API_KEY = os.getenv("GENAI_API_KEY")
-BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+# Default per-call timeout in seconds (individual calls may override it)
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "60"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "32"))
+
+_limits = httpx.Limits(max_connections=GEMINI_MAX_CONNECTIONS, max_keepalive_connections=GEMINI_MAX_CONNECTIONS)
+_async_client = None
+_sync_client = None
+_sync_lock = threading.Lock()
+
+
+class GeminiError(Exception):
+    """Base class for Gemini failures. status_code is the HTTP status when there was one."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GeminiAPIError(GeminiError):
+    """The API answered with an error status."""
+
+
+class GeminiRateLimitError(GeminiAPIError):
+    """429: quota exceeded."""
+
+
+class GeminiTimeoutError(GeminiError, TimeoutError):
+    pass
+
+
+class GeminiConnectionError(GeminiError, ConnectionError):
+    pass
+
+
+class GeminiResponseError(GeminiError):
+    """The response had no usable text (blocked prompt, empty candidates, malformed body)."""
+
+
+def get_async_client():
+    """Shared keep-alive client for the async API."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(limits=_limits, timeout=GEMINI_TIMEOUT_S, headers=_headers())
+    return _async_client
+
+
+def get_sync_client():
+    """Shared keep-alive client for blocking callers."""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(limits=_limits, timeout=GEMINI_TIMEOUT_S, headers=_headers())
+    return _sync_client
+
+
+def _headers():
+    return {"Content-Type": "application/json", "x-goog-api-key": API_KEY or ""}
+
+
+def _url(model, method):
+    return f"{BASE_URL}/{model}:{method}"
 
-# Function to generate text using Gemini API
-def generate_text(prompt: str) -> str:
-    """Generate text using Gemini API."""
-    url = f"{BASE_URL}?key={API_KEY}"
-    headers = {"Content-Type": "application/json"}
-    data = {
-        "contents": [
-            {
-                "parts": [{"text": prompt}]
-            }
-        ]
-    }
 
+def _payload(prompt, system_prompt=None, temperature=None, max_tokens=None, json_mode=False):
+    data = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+    if system_prompt:
+        data["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+    config = {}
+    if temperature is not None:
+        config["temperature"] = temperature
+    if max_tokens is not None:
+        config["maxOutputTokens"] = max_tokens
+    if json_mode:
+        config["responseMimeType"] = "application/json"
+    if config:
+        data["generationConfig"] = config
+    return data
+
+
+def _raise_for_status(response):
+    if response.status_code < 400:
+        return
+    try:
+        message = response.json().get("error", {}).get("message", response.text)
+    except ValueError:
+        message = response.text
+    error_class = GeminiRateLimitError if response.status_code == 429 else GeminiAPIError
+    raise error_class(f"Gemini API error {response.status_code}: {message}", response.status_code)
+
+
+def _text(result, allow_empty=False):
+    """Joins the text parts of the first candidate."""
+    candidates = result.get("candidates") or []
+    if not candidates:
+        reason = result.get("promptFeedback", {}).get("blockReason")
+        if allow_empty and not reason:
+            return ""
+        raise GeminiResponseError(f"No candidates returned{f' (blocked: {reason})' if reason else ''}")
+    parts = candidates[0].get("content", {}).get("parts", [])
+    text = "".join(part.get("text", "") for part in parts)
+    if not text and not allow_empty:
+        raise GeminiResponseError(f"Empty response (finishReason: {candidates[0].get('finishReason')})")
+    return text
+
+
+def _json(response):
+    try:
+        return response.json()
+    except ValueError:
+        raise GeminiResponseError(f"Malformed response body: {response.text[:200]}")
+
+
+def _transport_error(e):
+    if isinstance(e, httpx.TimeoutException):
+        return GeminiTimeoutError(f"Gemini request timed out: {e}")
+    return GeminiConnectionError(f"Gemini request failed: {e}")
+
+
+def _total_tokens(result):
+    return (result.get("usageMetadata") or {}).get("totalTokenCount", 0)
+
+
+async def agenerate_text_with_usage(prompt, system_prompt=None, model=GEMINI_MODEL, temperature=None, max_tokens=None, timeout=None, json_mode=False):
+    """Like agenerate_text, but returns (text, total_tokens) from the response's usageMetadata."""
+    try:
+        with metrics.timed(f"llm.{model}"):
+            response = await get_async_client().post(
+                _url(model, "generateContent"),
+                json=_payload(prompt, system_prompt, temperature, max_tokens, json_mode),
+                timeout=timeout or GEMINI_TIMEOUT_S,
+            )
+    except httpx.TransportError as e:
+        raise _transport_error(e)
+    _raise_for_status(response)
+    result = _json(response)
+    total_tokens = _total_tokens(result)
+    metrics.incr(f"llm.{model}.tokens", total_tokens)
+    return _text(result), total_tokens
+
+
+async def agenerate_text(prompt, system_prompt=None, model=GEMINI_MODEL, temperature=None, max_tokens=None, timeout=None, json_mode=False):
+    """Generates text without blocking the event loop. Raises a GeminiError on failure."""
+    text, _ = await agenerate_text_with_usage(prompt, system_prompt, model, temperature, max_tokens, timeout, json_mode)
+    return text
+
+
+async def astream_text(prompt, system_prompt=None, model=GEMINI_MODEL, temperature=None, max_tokens=None, timeout=None):
+    """Yields the text in chunks via streamGenerateContent. Closing the generator aborts the request."""
+    start = time.perf_counter()
+    first_chunk = True
+    try:
+        async with get_async_client().stream(
+            "POST",
+            _url(model, "streamGenerateContent") + "?alt=sse",
+            json=_payload(prompt, system_prompt, temperature, max_tokens),
+            timeout=timeout or GEMINI_TIMEOUT_S,
+        ) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                _raise_for_status(response)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                text = _text(json.loads(line[len("data:"):]), allow_empty=True)
+                if text:
+                    if first_chunk:
+                        metrics.observe(f"llm.{model}.first_token", time.perf_counter() - start)
+                        first_chunk = False
+                    yield text
+    except httpx.TransportError as e:
+        raise _transport_error(e)
+    finally:
+        metrics.observe(f"llm.{model}.stream", time.perf_counter() - start)
+
+
+# Function to generate text using Gemini API
+def generate_text(prompt: str, system_prompt=None, model=GEMINI_MODEL, temperature=None, max_tokens=None, timeout=None) -> str:
+    """Generate text using Gemini API (blocking; async code should await agenerate_text)."""
     try:
-        # Send request to Gemini API
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        response.raise_for_status()
-
-        # Parse the response
-        result = response.json()
-        gemini_response = (
-            result.get("candidates", [{}])[0]
-            .get("content", {})
-            .get("parts", [{}])[0]
-            .get("text", "No response")
-        )
-
-        return gemini_response
-
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+        with metrics.timed(f"llm.{model}"):
+            response = get_sync_client().post(
+                _url(model, "generateContent"),
+                json=_payload(prompt, system_prompt, temperature, max_tokens),
+                timeout=timeout or GEMINI_TIMEOUT_S,
+            )
+    except httpx.TransportError as e:
+        raise _transport_error(e)
+    _raise_for_status(response)
+    return _text(_json(response))
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+import metrics
+from llm_router import complete
+
+load_dotenv()
+
+# Number of name-templated greetings kept ready, and the level that triggers a background refill
+GREETING_POOL_SIZE = int(os.getenv("GREETING_POOL_SIZE", "30"))
+GREETING_POOL_LOW_WATER = int(os.getenv("GREETING_POOL_LOW_WATER", "10"))
+# A reload within this many seconds gets the employee's previous greeting back
+GREETING_REUSE_TTL_S = float(os.getenv("GREETING_REUSE_TTL_S", "1800"))
+GREETING_RECENT_MAX = 10000
+NAME_PLACEHOLDER = "{name}"
+
+SYSTEM_PROMPT = "You are a friendly and professional HR assistant designed to check in on employees in a warm and concise manner. Always keep the tone polite, supportive, and under 2 lines."
+
+
+def _is_valid_template(template):
+    return (
+        isinstance(template, str)
+        and template.count(NAME_PLACEHOLDER) == 1
+        and "{" not in template.replace(NAME_PLACEHOLDER, "")
+        and len(template) <= 300
+        and len(template.strip().splitlines()) <= 2
+    )
+
+
+class GreetingEngine:
+    """
+    Serves conversation greetings from a pool of pre-generated, name-templated greetings.
+    The pool is refilled in the background with one LLM call; when it is empty a greeting is
+    generated on demand. Each employee's latest greeting is reused for quick reloads.
+    """
+
+    def __init__(self, pool_size=GREETING_POOL_SIZE, low_water=GREETING_POOL_LOW_WATER, reuse_ttl=GREETING_REUSE_TTL_S):
+        self.pool_size = pool_size
+        self.low_water = low_water
+        self.reuse_ttl = reuse_ttl
+        self._pool = deque()
+        self._recent = OrderedDict()
+        self._refill_task = None
+
+    async def greeting_for(self, employee_id, employee_name):
+        recent = self._recent.get(employee_id)
+        if recent is not None and time.monotonic() - recent[1] < self.reuse_ttl:
+            metrics.incr("greetings.reused")
+            return recent[0]
+
+        if self._pool:
+            greeting = self._pool.popleft().replace(NAME_PLACEHOLDER, employee_name or "there")
+            metrics.incr("greetings.pool_hit")
+        else:
+            metrics.incr("greetings.on_demand")
+            greeting = await self._generate_for(employee_name)
+        self._remember(employee_id, greeting)
+        self.start_refill()
+        return greeting
+
+    def start_refill(self):
+        """Schedules a background refill if the pool is low and none is running. Must be called from the event loop."""
+        if len(self._pool) >= self.low_water:
+            return
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+        self._refill_task = asyncio.create_task(self.refill())
+
+    async def refill(self):
+        """Generates a batch of templates with one LLM call and adds the valid ones to the pool."""
+        wanted = self.pool_size - len(self._pool)
+        if wanted <= 0:
+            return 0
+        user_prompt = (
+            f"Write {wanted} different short greetings for an employee starting a regular wellbeing check-in. "
+            f"Each greeting must contain the placeholder {NAME_PLACEHOLDER} exactly once where the employee's name goes, "
+            "let them know this is a regular check-in to see how they're doing today, and stay short and caring. "
+            'Respond with JSON of the form {"greetings": ["...", "..."]} and nothing else.'
+        )
+        try:
+            response = json.loads(await complete("greeting", SYSTEM_PROMPT, user_prompt, temperature=1.0, max_tokens=2000, json_mode=True))
+            templates = [t.strip() for t in response.get("greetings", []) if _is_valid_template(t)]
+        except Exception as e:
+            print(f"Error refilling greeting pool: {e}")
+            metrics.incr("greetings.refill_failed")
+            return 0
+        random.shuffle(templates)
+        self._pool.extend(templates[:wanted])
+        metrics.incr("greetings.refilled", len(templates[:wanted]))
+        return len(templates[:wanted])
+
+    async def _generate_for(self, employee_name):
+        user_prompt = f"The employee's name is {employee_name}. Greet them and let them know this is a regular check-in to see how they're doing today. Keep it short and caring."
+        return await complete("greeting", SYSTEM_PROMPT, user_prompt)
+
+    def _remember(self, employee_id, greeting):
+        self._recent[employee_id] = (greeting, time.monotonic())
+        self._recent.move_to_end(employee_id)
+        while len(self._recent) > GREETING_RECENT_MAX:
+            self._recent.popitem(last=False)
+
+    def stats(self):
+        return {"pool": len(self._pool), "recent": len(self._recent)}
+
+
+greeting_engine = GreetingEngine()
+
+
+def get_greeting_engine():
+    return greeting_engine
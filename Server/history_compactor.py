@@ -0,0 +1,168 @@
+import asyncio
+import os
+from collections import OrderedDict
+from dotenv import load_dotenv
+import metrics
+from llm_router import complete
+from token_count import count_tokens
+
+load_dotenv()
+
+# Most recent messages always kept verbatim
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+# Token budget for the history block of a chat-turn prompt, and for report prompts
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+REPORT_HISTORY_TOKEN_BUDGET = int(os.getenv("REPORT_HISTORY_TOKEN_BUDGET", "3000"))
+# Older messages are folded into the summary once this many have piled up outside the verbatim window
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "4"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+HISTORY_MAX_CONVERSATIONS = int(os.getenv("HISTORY_MAX_CONVERSATIONS", "1024"))
+
+ROLES = ("Employee", "Chatbot")
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+
+def parse_history(chat_history):
+    """
+    Splits a history into [(role, content)] turns. Accepts the "Role: text" lines built by the chat
+    routes or a list of {"role", "content"} dicts. Lines without a role prefix continue the previous turn.
+    """
+    if isinstance(chat_history, list):
+        return [(turn.get("role"), turn.get("content", "")) for turn in chat_history]
+    turns = []
+    for line in str(chat_history or "").splitlines():
+        role, sep, content = line.partition(": ")
+        if sep and role in ROLES:
+            turns.append((role, content))
+        elif turns:
+            turns[-1] = (turns[-1][0], f"{turns[-1][1]}\n{line}")
+        elif line.strip():
+            turns.append((None, line))
+    return turns
+
+
+def format_turns(turns):
+    return "\n".join(f"{role}: {content}" if role else content for role, content in turns)
+
+
+class _Summary:
+    """Running summary of a conversation's first `covered` turns."""
+
+    def __init__(self):
+        self.text = ""
+        self.covered = 0
+        self.task = None
+
+
+class HistoryCompactor:
+    """
+    Keeps the last `keep_turns` messages verbatim and folds older ones into a per-conversation summary
+    that is updated incrementally in the background, so the history in a prompt stays within a token
+    budget however long the conversation gets. Messages not yet summarized are kept verbatim, newest
+    first, while they fit.
+    """
+
+    def __init__(self, keep_turns=HISTORY_KEEP_TURNS, token_budget=HISTORY_TOKEN_BUDGET, summary_batch=HISTORY_SUMMARY_BATCH):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_batch = summary_batch
+        self._summaries = OrderedDict()
+
+    def _state(self, key, older_count):
+        state = self._summaries.get(key)
+        if state is None or state.covered > older_count:
+            # New conversation, or a history that doesn't extend the one we summarized
+            state = self._summaries[key] = _Summary()
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > HISTORY_MAX_CONVERSATIONS:
+            self._summaries.popitem(last=False)
+        return state
+
+    async def _summarize(self, state, older):
+        new_turns = older[state.covered:]
+        system_prompt = (
+            "You maintain a running summary of a workplace wellbeing check-in between an HR chatbot and an employee. "
+            "Keep the employee's feelings, concerns, facts they shared and any answers that could later be contradicted. "
+            "Return only the updated summary."
+        )
+        user_prompt = f"""
+Current summary:
+{state.text or "(none yet)"}
+
+New messages:
+{format_turns(new_turns)}
+
+Return the updated summary in at most 150 words.
+"""
+        try:
+            with metrics.timed("history.summarize"):
+                summary = await complete("history_summary", system_prompt, user_prompt, temperature=0.3, max_tokens=HISTORY_SUMMARY_MAX_TOKENS)
+            state.text, state.covered = summary.strip(), len(older)
+        except Exception as e:
+            print(f"Error summarizing conversation history: {e}")
+            metrics.incr("history.summary_failed")
+
+    def _refresh(self, state, older):
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._summarize(state, older))
+        return state.task
+
+    async def compact(self, chat_history, key=None, token_budget=None, wait=False):
+        """
+        Returns the history as prompt text within `token_budget` tokens (the recent window is kept even
+        if it alone is larger). `key` identifies the conversation whose summary is reused and updated;
+        without it older messages are only trimmed. With `wait` the summary is brought up to date first.
+        """
+        budget = token_budget or self.token_budget
+        turns = parse_history(chat_history)
+        text = format_turns(turns)
+        if count_tokens(text) <= budget:
+            metrics.incr("history.verbatim")
+            return text
+
+        metrics.incr("history.compacted")
+        recent = turns[-self.keep_turns:]
+        older = turns[:-self.keep_turns]
+        summary = ""
+        pending = older
+        if key is not None and older:
+            state = self._state(key, len(older))
+            if wait:
+                # A refresh already in flight may cover fewer messages; keep going until caught up
+                while state.covered < len(older):
+                    covered = state.covered
+                    await self._refresh(state, older)
+                    if state.covered == covered:
+                        break
+            elif len(older) - state.covered >= self.summary_batch:
+                self._refresh(state, older)
+            summary, pending = state.text, older[state.covered:]
+
+        used = count_tokens(summary) + count_tokens(format_turns(recent))
+        kept = []
+        for turn in reversed(pending):
+            cost = count_tokens(format_turns([turn]))
+            if used + cost > budget:
+                break
+            kept.append(turn)
+            used += cost
+        kept.reverse()
+
+        lines = []
+        if summary:
+            lines.append(f"{SUMMARY_PREFIX} {summary}")
+        if len(kept) < len(pending):
+            lines.append(f"[{len(pending) - len(kept)} earlier messages omitted]")
+        lines.append(format_turns(kept + recent))
+        return "\n".join(line for line in lines if line)
+
+
+history_compactor = HistoryCompactor()
+
+
+def get_history_compactor():
+    return history_compactor
+
+
+async def compact_history(chat_history, conversation_id=None, token_budget=None, wait=False):
+    return await history_compactor.compact(chat_history, conversation_id, token_budget, wait)
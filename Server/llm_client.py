@@ -0,0 +1,187 @@
+import asyncio
+import os
+import threading
+import time
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+import metrics
+from resilience import estimate_tokens, get_guard
+
+# Load environment variables
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+# Default per-call timeout in seconds (individual calls may override it)
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+# Size of the shared HTTP connection pool to the provider
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+# Max completions in flight per worker, across every endpoint
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+_limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+
+_async_client = None
+_semaphore = None
+_sync_client = None
+_sync_semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_sync_lock = threading.Lock()
+
+
+def get_async_client():
+    """Shared AsyncOpenAI client backed by one pooled keep-alive HTTP client."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=LLM_TIMEOUT_S,
+            # Retries are done by the resilience layer, which also knows about the circuit and quota
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=_limits, timeout=LLM_TIMEOUT_S),
+        )
+    return _async_client
+
+
+def get_sync_client():
+    """Shared blocking OpenAI client for code that can't await (see `chat`)."""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = OpenAI(
+                    api_key=OPENAI_API_KEY,
+                    timeout=LLM_TIMEOUT_S,
+                    max_retries=0,
+                    http_client=httpx.Client(limits=_limits, timeout=LLM_TIMEOUT_S),
+                )
+    return _sync_client
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def _messages(system_prompt, user_prompt):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _content(response):
+    if response.choices and len(response.choices) > 0 and response.choices[0].message.content:
+        return response.choices[0].message.content.strip()
+    print("Invalid response format:", response)
+    return "No valid response generated."
+
+
+async def achat_with_usage(system_prompt, user_prompt, model=OPENAI_MODEL, temperature=0.8, max_tokens=1000, timeout=None, json_mode=False):
+    """Like achat, but returns (text, total_tokens) so callers can account for the tokens they spend."""
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    guard = get_guard(f"openai:{model}")
+    estimated = estimate_tokens(system_prompt, user_prompt, max_tokens=max_tokens)
+
+    async def request():
+        async with _get_semaphore():
+            with metrics.timed(f"llm.{model}"):
+                return await get_async_client().chat.completions.create(
+                    model=model,
+                    messages=_messages(system_prompt, user_prompt),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    timeout=timeout or LLM_TIMEOUT_S,
+                    **extra,
+                )
+
+    response = await guard.call(request, estimated)
+    total_tokens = response.usage.total_tokens if response.usage else 0
+    guard.settle(estimated, total_tokens)
+    metrics.incr(f"llm.{model}.tokens", total_tokens)
+    return _content(response), total_tokens
+
+
+async def achat(system_prompt, user_prompt, model=OPENAI_MODEL, temperature=0.8, max_tokens=1000, timeout=None, json_mode=False):
+    """
+    Generates a chat completion without blocking the event loop. Retryable errors are retried with
+    backoff; anything else (or the last failure) is raised to the caller.
+    With json_mode the model is constrained to return a single JSON object.
+    """
+    text, _ = await achat_with_usage(system_prompt, user_prompt, model, temperature, max_tokens, timeout, json_mode)
+    return text
+
+
+async def astream_chat(system_prompt, user_prompt, model=OPENAI_MODEL, temperature=0.8, max_tokens=1000, timeout=None):
+    """
+    Yields the completion text in chunks as it is generated. Closing the generator aborts the request.
+    Only opening the stream is retried; once tokens have been yielded an error is raised as is.
+    """
+    guard = get_guard(f"openai:{model}")
+    estimated = estimate_tokens(system_prompt, user_prompt, max_tokens=max_tokens)
+    semaphore = _get_semaphore()
+
+    async def request():
+        # Held for the life of the stream, but not while the guard waits out a throttle or backoff
+        await semaphore.acquire()
+        try:
+            return await get_async_client().chat.completions.create(
+                model=model,
+                messages=_messages(system_prompt, user_prompt),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout or LLM_TIMEOUT_S,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        except BaseException:
+            semaphore.release()
+            raise
+
+    start = time.perf_counter()
+    stream = await guard.call(request, estimated)
+    first_token = True
+    parts = []
+    total_tokens = 0
+    try:
+        async for chunk in stream:
+            if chunk.usage:
+                # Sent in a final chunk without choices
+                total_tokens = chunk.usage.total_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token:
+                    metrics.observe(f"llm.{model}.first_token", time.perf_counter() - start)
+                    first_token = False
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+        semaphore.release()
+        if not total_tokens:
+            # Aborted before the usage chunk: bill the prompt plus what was generated
+            total_tokens = estimate_tokens(system_prompt, user_prompt, "".join(parts))
+        guard.settle(estimated, total_tokens)
+        metrics.incr(f"llm.{model}.tokens", total_tokens)
+        metrics.observe(f"llm.{model}.stream", time.perf_counter() - start)
+
+
+def chat(system_prompt, user_prompt, model=OPENAI_MODEL, temperature=0.8, max_tokens=1000, timeout=None):
+    """Blocking shim over the same pool settings, for sync callers (threadpool routes, scripts)."""
+    def request():
+        with _sync_semaphore:
+            with metrics.timed(f"llm.{model}"):
+                return get_sync_client().chat.completions.create(
+                    model=model,
+                    messages=_messages(system_prompt, user_prompt),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    timeout=timeout or LLM_TIMEOUT_S,
+                )
+
+    guard = get_guard(f"openai:{model}")
+    estimated = estimate_tokens(system_prompt, user_prompt, max_tokens=max_tokens)
+    response = guard.call_sync(request, estimated)
+    guard.settle(estimated, response.usage.total_tokens if response.usage else 0)
+    return _content(response)
@@ -0,0 +1,205 @@
+import abc
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+import metrics
+import gemini
+from llm_client import OPENAI_MODEL, achat_with_usage
+from resilience import estimate_tokens, get_guard
+
+load_dotenv()
+
+# Per-call-site routing. "providers" is the preference order (later entries are failovers);
+# "hedge_after_ms" fires the same prompt at the next provider if the current one hasn't answered
+# by then, and the first answer wins. LLM_ROUTES (JSON, same shape) overrides individual sites.
+DEFAULT_ROUTES = {
+    "default": {"providers": ["openai", "gemini"]},
+    "contradiction": {"providers": ["openai", "gemini"], "hedge_after_ms": 2500},
+    "follow_up": {"providers": ["openai", "gemini"], "hedge_after_ms": 2500},
+    "next_question": {"providers": ["openai", "gemini"], "hedge_after_ms": 2500},
+    "test": {"providers": ["gemini", "openai"]},
+}
+ROUTES = {**DEFAULT_ROUTES, **json.loads(os.getenv("LLM_ROUTES", "{}"))}
+
+# A provider whose error rate over its last HEALTH_WINDOW calls reaches HEALTH_MAX_ERROR_RATE
+# (with at least HEALTH_MIN_SAMPLES calls) is moved to the back of every route for HEALTH_COOLDOWN_S
+HEALTH_WINDOW = int(os.getenv("LLM_HEALTH_WINDOW", "20"))
+HEALTH_MIN_SAMPLES = int(os.getenv("LLM_HEALTH_MIN_SAMPLES", "5"))
+HEALTH_MAX_ERROR_RATE = float(os.getenv("LLM_HEALTH_MAX_ERROR_RATE", "0.5"))
+HEALTH_COOLDOWN_S = float(os.getenv("LLM_HEALTH_COOLDOWN_S", "30"))
+
+
+class Provider(abc.ABC):
+    """A completion backend. complete() returns (text, total_tokens) and raises on failure."""
+
+    name = ""
+    supports_json = False
+
+    @abc.abstractmethod
+    async def complete(self, system_prompt, user_prompt, **options):
+        ...
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    supports_json = True
+
+    async def complete(self, system_prompt, user_prompt, model=None, temperature=0.8, max_tokens=1000, timeout=None, json_mode=False):
+        return await achat_with_usage(system_prompt, user_prompt, model=model or OPENAI_MODEL, temperature=temperature,
+                                      max_tokens=max_tokens, timeout=timeout, json_mode=json_mode)
+
+
+class GeminiProvider(Provider):
+    """The `model` option names an OpenAI model and is ignored; GEMINI_MODEL is used."""
+
+    name = "gemini"
+    supports_json = True
+
+    async def complete(self, system_prompt, user_prompt, model=None, temperature=0.8, max_tokens=1000, timeout=None, json_mode=False):
+        guard = get_guard("gemini")
+        estimated = estimate_tokens(system_prompt, user_prompt, max_tokens=max_tokens)
+        text, total_tokens = await guard.call(
+            lambda: gemini.agenerate_text_with_usage(user_prompt, system_prompt or None, temperature=temperature, max_tokens=max_tokens,
+                                                     timeout=timeout, json_mode=json_mode),
+            estimated,
+        )
+        guard.settle(estimated, total_tokens)
+        return text.strip(), total_tokens
+
+
+class ProviderHealth:
+    """Rolling error rate of a provider's recent calls, with a cooldown once it gets too high."""
+
+    def __init__(self):
+        self.outcomes = deque(maxlen=HEALTH_WINDOW)
+        self.unhealthy_until = 0.0
+
+    def record(self, ok):
+        self.outcomes.append(ok)
+        if len(self.outcomes) >= HEALTH_MIN_SAMPLES and self.error_rate() >= HEALTH_MAX_ERROR_RATE:
+            self.unhealthy_until = time.monotonic() + HEALTH_COOLDOWN_S
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+
+class LLMRouter:
+    def __init__(self, providers, routes=None):
+        self.providers = {provider.name: provider for provider in providers}
+        self.routes = routes if routes is not None else ROUTES
+        self.health = {name: ProviderHealth() for name in self.providers}
+
+    def candidates(self, site, json_mode=False):
+        """The site's providers in preference order, with unhealthy ones moved to the back."""
+        route = self.routes.get(site) or self.routes["default"]
+        providers = [self.providers[name] for name in route["providers"] if name in self.providers]
+        if json_mode:
+            providers = [provider for provider in providers if provider.supports_json]
+        return sorted(providers, key=lambda provider: not self.health[provider.name].healthy())
+
+    async def _call(self, provider, system_prompt, user_prompt, options):
+        start = time.perf_counter()
+        try:
+            result = await provider.complete(system_prompt, user_prompt, **options)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the provider's health
+            raise
+        except Exception as e:
+            print(f"Error from LLM provider {provider.name}: {e}")
+            self.health[provider.name].record(False)
+            metrics.incr(f"router.{provider.name}.errors")
+            raise
+        metrics.observe(f"router.{provider.name}", time.perf_counter() - start)
+        self.health[provider.name].record(True)
+        return result
+
+    async def complete_with_usage(self, site, system_prompt, user_prompt, **options):
+        """
+        Runs the prompt on the site's route and returns (text, total_tokens). A failed provider is
+        replaced by the next one; a slow one is hedged after the route's hedge_after_ms.
+        Raises the last provider error if every provider fails.
+        """
+        route = self.routes.get(site) or self.routes["default"]
+        hedge_after_ms = route.get("hedge_after_ms")
+        queue = self.candidates(site, options.get("json_mode", False))
+        if not queue:
+            raise RuntimeError(f"No LLM provider available for '{site}'")
+
+        pending = {}
+        last_error = None
+
+        def launch():
+            provider = queue.pop(0)
+            pending[asyncio.create_task(self._call(provider, system_prompt, user_prompt, options))] = provider
+
+        launch()
+        try:
+            while pending:
+                timeout = hedge_after_ms / 1000 if hedge_after_ms and queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.incr(f"router.{site}.hedged")
+                    launch()
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        metrics.incr(f"router.{site}.served_by.{provider.name}")
+                        return task.result()
+                    last_error = task.exception()
+                if not pending and queue:
+                    metrics.incr(f"router.{site}.failover")
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    async def complete(self, site, system_prompt, user_prompt, **options):
+        text, _ = await self.complete_with_usage(site, system_prompt, user_prompt, **options)
+        return text
+
+    def stats(self):
+        return {
+            name: {
+                "healthy": health.healthy(),
+                "error_rate": round(health.error_rate(), 3),
+                "recent_calls": len(health.outcomes),
+            }
+            for name, health in self.health.items()
+        }
+
+
+def default_providers():
+    providers = [OpenAIProvider()]
+    # Only route to Gemini when it is configured, otherwise every failover/hedge would just fail
+    if gemini.API_KEY:
+        providers.append(GeminiProvider())
+    return providers
+
+
+llm_router = None
+
+
+def get_llm_router():
+    global llm_router
+    if llm_router is None:
+        llm_router = LLMRouter(default_providers())
+    return llm_router
+
+
+async def complete_with_usage(site, system_prompt, user_prompt, **options):
+    return await get_llm_router().complete_with_usage(site, system_prompt, user_prompt, **options)
+
+
+async def complete(site, system_prompt, user_prompt, **options):
+    return await get_llm_router().complete(site, system_prompt, user_prompt, **options)
+
@@ -4,13 +4,20 @@ from typing import List, Annotated
 from fastapi.middleware.cors import CORSMiddleware
 from routes import chats
 from sqlalchemy.orm import Session,sessionmaker
-from routes import check_database, auth, report # Import the user router
+from routes import check_database, auth, report, metrics # Import the user router
 import psycopg2,os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from database.models import Base
-from database.conn import engine
+from pagination import PAGE_HEADERS
+from database.conn import engine, async_engine
+from database.migrations import run_migrations
+from embeddings import get_embedding_service
+from embedding_batcher import get_embedding_batcher
+from question_index import get_question_index
+from greetings import get_greeting_engine
+from conversation_state import get_conversation_state
 
 app = FastAPI()
 
@@ -20,13 +27,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=PAGE_HEADERS,  # Lets the client read the pagination cursor and total
 )
 
 app.include_router(chats.router, prefix="/api/conversation", tags=["chats"])
 app.include_router(check_database.router, prefix="/api/data", tags=["database"])
 app.include_router(auth.router, prefix="/api/user", tags=["auth"])
 app.include_router(report.router, prefix="/api/report", tags=["report"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
 
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    # Drop question state left behind by conversations that were abandoned
+    get_conversation_state().purge_expired()
+    # Load the embedding model once so the first chat turn doesn't pay for it
+    get_embedding_service().warm()
+    # Build (first boot after a bank change) or mmap the precomputed question vectors
+    get_question_index()
+    get_embedding_batcher().start()
+
+@app.on_event("startup")
+async def fill_greeting_pool():
+    # Runs in the background; /start falls back to on-demand greetings until the pool is filled
+    get_greeting_engine().start_refill()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Number of recent samples kept per timer for percentile estimates
+SAMPLE_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timers = {}
+
+
+class LatencyStats:
+    """Running count/total/max plus a window of recent samples for percentiles."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+def incr(name, value=1):
+    """Increments the named counter."""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds):
+    """Records one latency sample (in seconds) for the named timer."""
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            stats = _timers[name] = LatencyStats()
+        stats.add(seconds)
+
+
+@contextmanager
+def timed(name):
+    """Times the wrapped block and records it under `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot():
+    """Returns a JSON-serialisable copy of every counter and timer."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "timers": {name: stats.to_dict() for name, stats in _timers.items()},
+        }
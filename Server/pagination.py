@@ -0,0 +1,38 @@
+import base64
+import json
+from datetime import date, time
+
+# Paginated list endpoints keep returning a plain list; the page metadata travels in these headers
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+PAGE_HEADERS = [NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER]
+
+
+def encode_cursor(*values):
+    """Opaque cursor for the sort key of the last row of a page (dates and times as ISO strings)."""
+    raw = json.dumps([value.isoformat() if isinstance(value, (date, time)) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, *types):
+    """Parses a cursor made by encode_cursor back into `types`. Raises ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(kind.fromisoformat(value) if kind in (date, time) else kind(value) for kind, value in zip(types, values))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def set_page_headers(response, rows, limit, cursor_of, total=None):
+    """
+    Trims `rows` (fetched with limit + 1) to the page, sets the next-cursor and total headers on
+    `response`, and returns the page. With no `limit` every row is one page.
+    """
+    page = rows[:limit]
+    if limit is not None and len(rows) > limit:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_of(page[-1])
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+    return page
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from question_bank import question_bank
+from embeddings import get_embedding_service, EMBEDDING_MODEL_NAME
+
+load_dotenv()
+
+# Directory holding the persisted matrix/metadata pairs, one pair per bank hash
+QUESTION_INDEX_DIR = os.getenv("QUESTION_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_index"))
+
+
+def question_bank_hash(bank=question_bank, model_name=EMBEDDING_MODEL_NAME):
+    """Content hash of the bank (and the model that embeds it), used as the index key."""
+    payload = json.dumps({"model": model_name, "bank": bank}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def flatten_question_bank(bank=question_bank):
+    """
+    Flattens the bank into one list of questions, keeping each topic's questions contiguous.
+    Returns (questions, topics) where topics maps topic -> [start, end) row offsets.
+    """
+    questions = []
+    topics = {}
+    for topic, value in bank.items():
+        start = len(questions)
+        questions.extend(value.get("questions", []))
+        topics[topic] = [start, len(questions)]
+    return questions, topics
+
+
+class QuestionIndex:
+    """Normalized float32 embedding matrix for every bank question, with per-topic row offsets."""
+
+    def __init__(self, matrix, questions, topics, content_hash):
+        self.matrix = matrix
+        self.questions = questions
+        self.topics = topics
+        self.content_hash = content_hash
+        self._rows = {}
+        for row, question in enumerate(questions):
+            self._rows.setdefault(question, row)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def row_of(self, question):
+        return self._rows.get(question)
+
+    def scores(self, query_vector, rows=None):
+        """Cosine similarity of the query against every (or the given) question row."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return matrix @ query
+
+    def topic_rows(self, topics):
+        """Row indices covering the contiguous blocks of the given topics (unknown topics are skipped)."""
+        blocks = [self.topics[t] for t in dict.fromkeys(topics) if t in self.topics]
+        if not blocks:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([np.arange(start, end, dtype=np.intp) for start, end in blocks])
+
+    def top_k(self, topics, query_vector, k=20):
+        """Top-k questions from the given topics for one query vector."""
+        rows = self.topic_rows(topics)
+        if rows.size == 0:
+            return []
+        scores = self.scores(query_vector, rows)
+        return [self.questions[r] for r in rows[_top_k_indices(scores, k)]]
+
+    def top_k_batch(self, topic_lists, query_matrix, k=20):
+        """
+        Top-k questions for many employees at once: `topic_lists[i]` pairs with row i of `query_matrix`.
+        All queries are scored against the whole bank with a single matrix product.
+        """
+        queries = np.asarray(query_matrix, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        all_scores = self.matrix @ queries.T
+        results = []
+        for column, topics in enumerate(topic_lists):
+            rows = self.topic_rows(topics)
+            if rows.size == 0:
+                results.append([])
+                continue
+            scores = all_scores[rows, column]
+            results.append([self.questions[r] for r in rows[_top_k_indices(scores, k)]])
+        return results
+
+
+def _top_k_indices(scores, k):
+    """Indices of the k highest scores, best first, without a full sort when k < n."""
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= scores.shape[0]:
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _index_paths(content_hash, directory=QUESTION_INDEX_DIR):
+    base = os.path.join(directory, f"questions-{content_hash}")
+    return f"{base}.npy", f"{base}.json"
+
+
+def build_question_index(directory=QUESTION_INDEX_DIR, force=False):
+    """
+    Embeds every bank question once and writes the matrix and metadata to disk.
+    Skips the work if an index for the current bank hash already exists.
+    """
+    content_hash = question_bank_hash()
+    matrix_path, meta_path = _index_paths(content_hash, directory)
+    if not force and os.path.exists(matrix_path) and os.path.exists(meta_path):
+        return matrix_path
+
+    start = time.perf_counter()
+    questions, topics = flatten_question_bank()
+    vectors = np.asarray(get_embedding_service().embed_documents(questions), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.maximum(norms, 1e-12)
+
+    os.makedirs(directory, exist_ok=True)
+    # Write to temporary files first so concurrent workers never mmap a half-written file
+    tmp_matrix, tmp_meta = f"{matrix_path}.{os.getpid()}.tmp", f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_matrix, "wb") as f:
+        np.save(f, vectors)
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump({
+            "content_hash": content_hash,
+            "model_name": EMBEDDING_MODEL_NAME,
+            "dimension": int(vectors.shape[1]),
+            "questions": questions,
+            "topics": topics,
+        }, f, ensure_ascii=False)
+    os.replace(tmp_matrix, matrix_path)
+    os.replace(tmp_meta, meta_path)
+    print(f"✅ Built question index {content_hash} ({len(questions)} questions) in {time.perf_counter() - start:.2f}s")
+    return matrix_path
+
+
+def load_question_index(directory=QUESTION_INDEX_DIR):
+    """Memory-maps the index for the current bank, building it first if it is missing."""
+    content_hash = question_bank_hash()
+    matrix_path, meta_path = _index_paths(content_hash, directory)
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        build_question_index(directory)
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    matrix = np.load(matrix_path, mmap_mode="r")
+    return QuestionIndex(matrix, meta["questions"], meta["topics"], content_hash)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_question_index():
+    """Process-wide question index, loaded on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_question_index()
+    return _index
+
+
+if __name__ == "__main__":
+    # Offline build step: `python question_index.py`
+    print(build_question_index(force=True))
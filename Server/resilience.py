@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import httpx
+from dotenv import load_dotenv
+import metrics
+from token_count import count_tokens
+
+load_dotenv()
+
+# Attempts per call (including the first) and the backoff envelope between them
+RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_S = float(os.getenv("LLM_RETRY_BASE_DELAY_S", "0.5"))
+RETRY_MAX_DELAY_S = float(os.getenv("LLM_RETRY_MAX_DELAY_S", "8"))
+# Consecutive retryable failures that open a provider/model circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+# Client-side quota per provider/model key ("openai:gpt-4o", "gemini", ...), requests and tokens per minute.
+# LLM_QUOTAS (JSON) overrides individual keys, e.g. {"openai:gpt-4": {"rpm": 200, "tpm": 40000}}
+DEFAULT_QUOTA = {
+    "rpm": int(os.getenv("LLM_DEFAULT_RPM", "5000")),
+    "tpm": int(os.getenv("LLM_DEFAULT_TPM", "800000")),
+}
+QUOTAS = json.loads(os.getenv("LLM_QUOTAS", "{}"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit is open."""
+
+    def __init__(self, key, retry_after):
+        super().__init__(f"Circuit open for {key}, retry in {retry_after:.1f}s")
+        self.key = key
+        self.retry_after = retry_after
+
+
+def status_code_of(error):
+    """HTTP status of a provider error, if it carries one (openai.APIStatusError, HTTPException, ...)."""
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status
+
+
+def is_retryable(error):
+    """Timeouts, dropped connections, rate limits and 5xx are worth retrying; bad requests are not."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    name = type(error).__name__
+    if name in ("APITimeoutError", "APIConnectionError"):
+        return True
+    return status_code_of(error) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_of(error):
+    """The provider's Retry-After hint in seconds, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, stretched to the provider's Retry-After hint when it gives one."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** attempt))
+    hint = retry_after_of(error) if error is not None else None
+    if hint is not None:
+        delay = max(delay, min(hint, RETRY_MAX_DELAY_S))
+    return delay
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. Opens after BREAKER_FAILURE_THRESHOLD consecutive failures and rejects
+    calls for BREAKER_RESET_S; then lets a single probe through (half-open), which closes or re-opens it.
+    """
+
+    def __init__(self, key, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_s=BREAKER_RESET_S):
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_s:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return
+            retry_after = max(0.0, self.reset_s - (time.monotonic() - self.opened_at))
+        metrics.incr(f"breaker.{self.key}.rejected")
+        raise CircuitOpenError(self.key, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                metrics.incr(f"breaker.{self.key}.closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def cancel_probe(self):
+        """A probe that was cancelled (e.g. lost a hedge race) proved nothing; let the next call probe."""
+        with self._lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.probing:
+                    metrics.incr(f"breaker.{self.key}.opened")
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+class TokenBucket:
+    """
+    Refills at `rate_per_s` up to `capacity`. reserve() takes the amount immediately (the balance may
+    go negative) and returns how long the caller must wait, so waiters are served in arrival order.
+    """
+
+    def __init__(self, rate_per_s, capacity):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_s)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate_per_s)
+
+    def refund(self, amount):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderGuard:
+    """Rate limits, retries and circuit-breaks the calls made to one provider/model."""
+
+    def __init__(self, key, quota=None):
+        quota = quota or QUOTAS.get(key) or DEFAULT_QUOTA
+        self.key = key
+        self.breaker = CircuitBreaker(key)
+        self.requests = TokenBucket(quota["rpm"] / 60, quota["rpm"])
+        self.tokens = TokenBucket(quota["tpm"] / 60, quota["tpm"])
+
+    def _reserve(self, estimated_tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        metrics.observe(f"ratelimit.{self.key}.queue_wait", wait)
+        if wait > 0:
+            metrics.incr(f"ratelimit.{self.key}.throttled")
+        return wait
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Returns over-estimated tokens to the bucket once the real usage is known."""
+        if actual_tokens and actual_tokens < estimated_tokens:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def refund(self, estimated_tokens):
+        """Returns a whole reservation, for attempts that failed or were cancelled before any usage was reported."""
+        if estimated_tokens:
+            self.tokens.refund(estimated_tokens)
+
+    def _failed(self, error, attempt):
+        """Records the failure and decides whether to retry it."""
+        if not is_retryable(error):
+            # The provider answered; the request itself was bad
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        metrics.incr(f"resilience.{self.key}.errors")
+        return attempt + 1 < RETRY_ATTEMPTS and self.breaker.state == "closed"
+
+    async def call(self, fn, estimated_tokens=0):
+        """
+        Awaits fn() with throttling, retries and the circuit breaker. fn must start a fresh request each time.
+        Failed and cancelled attempts get their token reservation back; the caller settles a successful
+        one with settle() once the real usage is known.
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            reserved = False
+            try:
+                wait = self._reserve(estimated_tokens)
+                reserved = True
+                if wait:
+                    await asyncio.sleep(wait)
+                result = await fn()
+            except asyncio.CancelledError:
+                # e.g. a hedge loser: the tokens it reserved were never spent
+                self.breaker.cancel_probe()
+                if reserved:
+                    self.refund(estimated_tokens)
+                raise
+            except Exception as e:
+                self.refund(estimated_tokens)
+                if not self._failed(e, attempt):
+                    raise
+                metrics.incr(f"resilience.{self.key}.retries")
+                await asyncio.sleep(backoff_delay(attempt, e))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def call_sync(self, fn, estimated_tokens=0):
+        """Blocking form of call(), for sync callers."""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            wait = self._reserve(estimated_tokens)
+            if wait:
+                time.sleep(wait)
+            try:
+                result = fn()
+            except Exception as e:
+                self.refund(estimated_tokens)
+                if not self._failed(e, attempt):
+                    raise
+                metrics.incr(f"resilience.{self.key}.retries")
+                time.sleep(backoff_delay(attempt, e))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        return {"circuit": self.breaker.state, "consecutive_failures": self.breaker.failures}
+
+
+def estimate_tokens(*texts, max_tokens=0):
+    """Estimated prompt size plus the completion budget, for the token bucket."""
+    return sum(count_tokens(text) for text in texts) + max_tokens
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(key):
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            guard = _guards[key] = ProviderGuard(key)
+        return guard
+
+
+def stats():
+    with _guards_lock:
+        return {key: guard.stats() for key, guard in _guards.items()}
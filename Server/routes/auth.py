@@ -1,4 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import timedelta
 # import firebase_admin
@@ -70,37 +72,53 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_user(token: str):
-    """
-    Verifies the JWT and returns the decoded claims.
-    """
-    db=next(get_db())
+def _user_lookup(token: str):
+    """Decodes the JWT and returns its claims with the query for the user row they name."""
     try:
         token= token.split(" ")[1]  # Extract token from "Bearer <token>"
         decoded_claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        emp_id = decoded_claims.get("emp_id")
-        hr_email = decoded_claims.get("hr_email")
-        print(hr_email)
-        role = decoded_claims.get("role")
-        if role=="employee":
-            user = db.query(Master).filter(Master.employee_id == emp_id).first()
-            if not user:
-                raise HTTPException(status_code=401, detail="Unauthorized")
-            return {"emp_id": emp_id, "role": role}
-        elif role=="hr":
-            user = db.query(HRUser).filter(HRUser.email == hr_email).first()
-            if not user:
-                raise HTTPException(status_code=401, detail="Unauthorized")
-            return {"hr_email": hr_email, "role": role}
-        
-        raise HTTPException(status_code=401, detail="Unauthorized")
-        
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    emp_id = decoded_claims.get("emp_id")
+    hr_email = decoded_claims.get("hr_email")
+    print(hr_email)
+    role = decoded_claims.get("role")
+    if role=="employee":
+        return {"emp_id": emp_id, "role": role}, select(Master).where(Master.employee_id == emp_id)
+    elif role=="hr":
+        return {"hr_email": hr_email, "role": role}, select(HRUser).where(HRUser.email == hr_email)
+
+    raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+def verify_user(token: str, db: Session = None):
+    """
+    Verifies the JWT and returns the decoded claims, plus the loaded Master/HRUser row as "user".
+    Pass the request's session as `db` to reuse that row instead of querying it again.
+    """
+    claims, query = _user_lookup(token)
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        user = db.execute(query).scalars().first()
     finally:
-        db.close()
+        if own_session:
+            db.close()
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return {**claims, "user": user}
+
+
+async def averify_user(token: str, db: AsyncSession):
+    """verify_user for routes on the async engine; loads the user with the request's AsyncSession."""
+    claims, query = _user_lookup(token)
+    user = (await db.execute(query)).scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return {**claims, "user": user}
 
 class UserResponse(BaseModel):
     employee_id: str
@@ -1,21 +1,28 @@
-from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form, Request
+from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form, Request, Response, Query
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, insert, select, tuple_
 import requests
 import json
+import asyncio
 from dotenv import load_dotenv
 import os
-from question_bank import question_bank
-from gemini import generate_text
-from database.conn import get_db
-from typing import List, Dict
-from datetime import datetime
-from chatgpt import chat_with_gpt4o
+from database.conn import get_db, get_async_db, AsyncSessionLocal, arelease_connection
+from typing import List, Dict, Optional
+from datetime import datetime, date, time
+from llm_router import complete
+from greetings import get_greeting_engine
+from history_compactor import REPORT_HISTORY_TOKEN_BUDGET, compact_history
+from pagination import decode_cursor, encode_cursor, set_page_headers
+from transcript_cache import CachedMessage, aconversation_messages, aconversation_transcript, format_transcript, get_transcript_cache
 import httpx
 import io
 from fastapi.responses import StreamingResponse
-from .auth import verify_user
-from .message import chatbot_conversation,retrieve_relevant_questions,generate_user_summary
+from .auth import averify_user
+from .report import content_error
+from .message import chatbot_conversation,stream_chatbot_conversation,retrieve_relevant_questions,get_cached_user_summary,start_next_question_prefetch,end_conversation
+import metrics
 
 
 from database.models import Conversation,Message, Master
@@ -37,8 +44,62 @@ class MessageRequest(BaseModel):
     conversation_id:int
     message:str
     message_type:str
-    chat_history: List[Dict[str, str]]
-    question_set: List[str] 
+    chat_history: Optional[List[Dict[str, str]]] = None  # Ignored: the history is rebuilt from the stored messages
+    question_set: Optional[List[str]] = None  # Ignored: the plan is stored on the conversation
+
+
+# Conversations whose first turn is computing the plan in this process; concurrent turns wait on the lock
+_plan_locks = {}
+
+
+async def get_conversation_plan(conversation, user, db):
+    """
+    Returns the conversation's relevant question set, computing and storing it on the first turn.
+    Concurrent first turns in this process wait for that one instead of retrieving again.
+    """
+    if conversation.question_set is not None:
+        return conversation.question_set
+    lock = _plan_locks.setdefault(conversation.id, asyncio.Lock())
+    try:
+        async with lock:
+            # A turn that held the lock before us may have stored the plan already
+            question_set = await db.scalar(select(Conversation.question_set).filter_by(id=conversation.id))
+            if question_set is not None:
+                return question_set
+            user_summary,summary_embedding=await get_cached_user_summary(user,db)
+            await arelease_connection(db)
+            question_set=await retrieve_relevant_questions(user_summary,list(user.shap_values),query_embedding=summary_embedding)
+            # Lock the row and re-check, since a turn served by another worker can get here too
+            conversation = (await db.execute(
+                select(Conversation).filter_by(id=conversation.id).with_for_update().execution_options(populate_existing=True)
+            )).scalars().first()
+            if conversation.question_set is None:
+                conversation.question_set=question_set
+            await db.commit()
+            return conversation.question_set
+    finally:
+        # Once the plan is stored every later turn finds it, so the lock is only needed while computing it
+        if _plan_locks.get(conversation.id) is lock and not lock.locked():
+            del _plan_locks[conversation.id]
+
+
+async def save_messages(db, conversation_id, *messages):
+    """
+    Writes a turn's messages with one INSERT ... RETURNING and a single commit, then appends them to
+    the cached transcript. `messages` are (content, sender_type, message_type) tuples; returns the new ids in order.
+    """
+    rows = (await db.execute(
+        insert(Message).values([
+            {"conversation_id": conversation_id, "content": content, "sender_type": sender_type, "message_type": message_type}
+            for content, sender_type, message_type in messages
+        ]).returning(Message.id, Message.time)
+    )).all()
+    await db.commit()
+    get_transcript_cache().append(conversation_id, [
+        CachedMessage(row.id, content, sender_type, message_type, row.time)
+        for row, (content, sender_type, message_type) in zip(rows, messages)
+    ])
+    return [row.id for row in rows]
 
 
 class PromptRequest(BaseModel):
@@ -46,27 +107,20 @@ class PromptRequest(BaseModel):
 
 
 @router.get("/start")
-async def start_conversation(request: Request, db: Session = Depends(get_db)):
+async def start_conversation(request: Request, db: AsyncSession = Depends(get_async_db)):
     try:
         token=request.headers.get("Authorization")
         if not token:
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_data=verify_user(token)
+        user_data=await averify_user(token,db)
         emp_id,role=user_data["emp_id"],user_data["role"]
-        user=db.query(Master).filter(Master.employee_id == emp_id).first()
+        user=user_data["user"]
         if role != "employee":
             raise HTTPException(status_code=401, detail="Unauthorized access")
-        system_prompt="You are a friendly and professional HR assistant designed to check in on employees in a warm and concise manner. Always keep the tone polite, supportive, and under 2 lines."
-        user_prompt=f"The employee's name is {user.employee_name}. Greet her and let her know this is a regular check-in to see how she’s doing today. Keep it short and caring."
-        greeting_message = chat_with_gpt4o(system_prompt,user_prompt)
-        new_message = Message(
-            content=greeting_message,
-            sender_type="chatbot",
-            message_type="welcome"
-        )
-        db.add(new_message)
-        db.commit()
-        db.refresh(new_message)
+        # The greeting may need an LLM call; don't hold a pooled connection meanwhile
+        await arelease_connection(db)
+        # Served from the pre-generated pool (or the employee's greeting from a recent reload)
+        greeting_message = await get_greeting_engine().greeting_for(user.employee_id, user.employee_name)
 
         # Pre-select the questions based on `shap` topics
        
@@ -78,144 +132,204 @@ async def start_conversation(request: Request, db: Session = Depends(get_db)):
         new_conversation = Conversation(
             employee_id=user.employee_id,
             employee_name=user.employee_name,
-            message_ids=[new_message.id],  # Store the message ID
             # date=now.date(),
             # time=now.time()
         )
         db.add(new_conversation)
-        db.commit()
-        db.refresh(new_conversation)
+        await db.flush()  # Assigns the conversation id for the greeting message
+        await save_messages(db, new_conversation.id, (greeting_message, "chatbot", "welcome"))
         return {"chatbot_response":greeting_message , "conversation_id":new_conversation.id}   # Send the conversation id along with the message
     except:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Error starting conversation")
 
 
 @router.post("/message")
-async def send_message(request:Request,db: Session = Depends(get_db)):
+async def send_message(request:Request,db: AsyncSession = Depends(get_async_db)):
     """
-    Accepts employee message, generates chatbot response, and appends both
-    message IDs to the existing conversation using `conversation_id`.
+    Accepts employee message, generates chatbot response, and stores both
+    messages under the existing conversation using `conversation_id`.
     """
     try:
         # Retrieve existing conversation using `conversation_id`
         token=request.headers.get("Authorization")
         if not token:
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_data=verify_user(token)
+        user_data=await averify_user(token,db)
         emp_id,role=user_data["emp_id"],user_data["role"]
-        user=db.query(Master).filter(Master.employee_id == emp_id).first()
+        user=user_data["user"]
         if role != "employee":
             raise HTTPException(status_code=401, detail="Unauthorized access")
         # how to get the body from the request in the form of MessageRequest
         body = await request.json()
         data = MessageRequest(**body)
-        conversation = db.query(Conversation).filter_by(id=data.conversation_id).first()
+        conversation = await db.get(Conversation, data.conversation_id)
 
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
+
+        if conversation.employee_id != emp_id:
+            raise HTTPException(status_code=403, detail="Unauthorized access to this conversation")
         
         # Get the relevant questions based on the user's SHAP values
-        relevant_questions = []
-        if data.question_set==[]:
-            question_set = []
-            selected_questions = {}
-            for topic in user.shap_values:
-                if topic in question_bank:
-                    selected_questions.update({topic: question_bank[topic]})
-            for key, value in selected_questions.items():
-                # question_set.append(f"{key}: {value['description']}")
-                for i, question in enumerate(value['questions'], 1):
-                    question_set.append(f"{question}")
-            user_summary=generate_user_summary(user.shap_nature)
-            relevant_questions=retrieve_relevant_questions(user_summary,question_set)
-        else:
-            relevant_questions=data.question_set
+        relevant_questions=await get_conversation_plan(conversation,user,db)
         # print("Relevant Questions:",relevant_questions)
         # print("User SHAP Values:",user.shap_values)
         # print("User Summary:",user_summary)
         # print("Message_Type:",data.message_type)
+        # The history so far (the employee's new message is stored with the reply)
+        chat_history_text = await aconversation_transcript(db, conversation.id) if data.message_type!="welcome" else ""
+        # Reads are done: give the connection back before the LLM phase, the writes use a new short transaction
+        await arelease_connection(db)
         if data.message_type=="welcome":
             # question_set
             
-            generated_message,message_type=chatbot_conversation(user.shap_values,[],"",data.message_type,relevant_questions)
+            generated_message,message_type=await chatbot_conversation(user.shap_values,[],"",data.message_type,relevant_questions,conversation.id)
             # Store the AI response in `Message` table
             print("Generated Message:",generated_message)
-            chatbot_message = Message(
-                content=generated_message,
-                sender_type="chatbot",
-                message_type=message_type
-            )
-            db.add(chatbot_message)
-            db.commit()
-            db.refresh(chatbot_message)
+            await save_messages(db, conversation.id, (generated_message, "chatbot", message_type))
             return {
                 "chatbot_response": generated_message,
                 "message_type":message_type,
-                "question_set": question_set
             }
 
-        # Store the employee's message in `Message` table
-        employee_message = Message(
-            content=data.message,
-            sender_type="employee",
-            message_type="user_msg"
-        )
-        db.add(employee_message)
-        db.commit()
-        db.refresh(employee_message)
-
-        # Retrieve the chat-history
-        chat_history  = data.chat_history
-        chat_history_text = "\n".join([
-            f"{msg['sender_type'].capitalize()}: {msg['message']}"
-            for msg in chat_history
-        ])
-
-        generated_message,message_type=chatbot_conversation(user.shap_values,chat_history_text,data.message,data.message_type,relevant_questions)
+        generated_message,message_type=await chatbot_conversation(user.shap_values,chat_history_text,data.message,data.message_type,relevant_questions,conversation.id)
         # generated_message = generated_message(selected_questions,chat_history_text, data.message)
 
-        # Store the AI response in `Message` table
+        # Store the employee's message and the AI response together in one transaction
         print("Generated Message:",generated_message)
-        chatbot_message = Message(
-            content=generated_message,
-            sender_type="chatbot",
-            message_type=message_type
-        )
-        db.add(chatbot_message)
-        db.commit()
-        db.refresh(chatbot_message)
-
-        # Append both message IDs to the existing conversation
-        conversation.message_ids.append(employee_message.id)
-        conversation.message_ids.append(chatbot_message.id)
-        db.commit()
+        await save_messages(db, conversation.id, (data.message, "employee", "user_msg"), (generated_message, "chatbot", message_type))
+
+        if message_type=="followup_2":
+            # The next turn switches topic: pick the next bank question while the employee types
+            start_next_question_prefetch(conversation.id,f"{chat_history_text}\nEmployee: {data.message}\nChatbot: {generated_message}",relevant_questions)
     
         return {
             "chatbot_response": generated_message,
             "message_type":message_type,
-            "question_set": relevant_questions
         }
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+def _sse(event, data):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/message/stream")
+async def stream_message(request:Request,db: AsyncSession = Depends(get_async_db)):
+    """
+    Streaming variant of /message. Sends the chatbot reply as Server-Sent Events
+    (`token` events, then one `done` event with the full reply and message_type) and
+    stores the chatbot message once the stream completes. If the client disconnects
+    mid-stream, generation is aborted and the partial reply is not stored.
+    """
+    try:
+        token=request.headers.get("Authorization")
+        if not token:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        user_data=await averify_user(token,db)
+        emp_id,role=user_data["emp_id"],user_data["role"]
+        if role != "employee":
+            raise HTTPException(status_code=401, detail="Unauthorized access")
+        user=user_data["user"]
+        body = await request.json()
+        data = MessageRequest(**body)
+        conversation = await db.get(Conversation, data.conversation_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        if conversation.employee_id != emp_id:
+            raise HTTPException(status_code=403, detail="Unauthorized access to this conversation")
+
+        relevant_questions=await get_conversation_plan(conversation,user,db)
+        shap_values=dict(user.shap_values or {})
+        conversation_id=conversation.id
+
+        chat_history_text=""
+        user_response=""
+        if data.message_type!="welcome":
+            chat_history_text = await aconversation_transcript(db, conversation_id)
+            # The employee's answer is stored up front so it survives a dropped stream
+            await save_messages(db, conversation_id, (data.message, "employee", "user_msg"))
+            user_response=data.message
+        await arelease_connection(db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+    async def event_stream():
+        completed=False
+        turn=stream_chatbot_conversation(shap_values,chat_history_text,user_response,data.message_type,relevant_questions,conversation_id)
+        try:
+            generated_message,message_type=None,None
+            async for event,payload in turn:
+                if await request.is_disconnected():
+                    return
+                if event=="token":
+                    yield _sse("token",{"text":payload})
+                else:
+                    generated_message,message_type=payload
+
+            # The request-scoped session may already be closed while streaming, so use a fresh one
+            async with AsyncSessionLocal() as save_db:
+                await save_messages(save_db, conversation_id, (generated_message, "chatbot", message_type))
+            completed=True
+            if message_type=="followup_2":
+                start_next_question_prefetch(conversation_id,f"{chat_history_text}\nEmployee: {user_response}\nChatbot: {generated_message}",relevant_questions)
+            yield _sse("done",{"chatbot_response":generated_message,"message_type":message_type})
+        except Exception as e:
+            print(f"Error in stream_message: {e}")
+            completed=True
+            yield _sse("error",{"detail":str(e)})
+        finally:
+            await turn.aclose()
+            if not completed:
+                metrics.incr("stream.disconnected")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"},
+    )
+
+
 @router.get("/history/employee")
-def get_conversation_history(request:Request,db:Session = Depends(get_db)):
+async def get_conversation_history(request:Request, response:Response, limit:Optional[int]=Query(None, ge=1, le=200), after:Optional[str]=None,
+                                   include_total:bool=False, db:AsyncSession = Depends(get_async_db)):
+    """
+    The employee's conversations, newest first, keyset-paginated on (date, time, id) when `limit`
+    is given (without it every conversation is returned). Pass the X-Next-Cursor header of a page as
+    `after` to get the next one; X-Total-Count is only computed with `include_total`.
+    """
     try:
         token=request.headers.get("Authorization")
         if not token:
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_data=verify_user(token)
+        user_data=await averify_user(token,db)
         emp_id,role=user_data["emp_id"],user_data["role"]
         # user=db.query(Master).filter(Master.employee_id == emp_id).first()
         if role != "employee":
             raise HTTPException(status_code=401, detail="Unauthorized access")
-        
-        conversations = db.query(Conversation).filter(Conversation.employee_id == emp_id).all()
-        if not conversations:
-            return []
+
+        conversations = select(Conversation.id, Conversation.date, Conversation.time).where(Conversation.employee_id == emp_id)
+        if after:
+            try:
+                after_key = decode_cursor(after, date, time, int)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            conversations = conversations.where(tuple_(Conversation.date, Conversation.time, Conversation.id) < tuple_(*after_key))
+        conversations = conversations.order_by(Conversation.date.desc(), Conversation.time.desc(), Conversation.id.desc())
+        if limit is not None:
+            conversations = conversations.limit(limit + 1)
+        rows = (await db.execute(conversations)).all()
+        total = None
+        if include_total:
+            total = (await db.execute(select(func.count(Conversation.id)).where(Conversation.employee_id == emp_id))).scalar()
+        page = set_page_headers(response, rows, limit, lambda conv: encode_cursor(conv.date, conv.time, conv.id), total)
         return [
             {
                 "conversation_id": conv.id,
@@ -223,27 +337,34 @@ def get_conversation_history(request:Request,db:Session = Depends(get_db)):
                 # "employee_name": conv.employee_name,
                 "date": conv.date,
                 "time": conv.time,
-            } for conv in conversations
+            } for conv in page
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetcging the conversations: {str(e)}")
 
 
 @router.get("/history/{conversation_id}")
 #how to get the token too
-def get_messages(conversation_id:str,request:Request,db:Session=Depends(get_db)):  # Ensure ID is int if it's an integer column
+async def get_messages(conversation_id:int, request:Request, response:Response, limit:Optional[int]=Query(None, ge=1, le=500), after:Optional[int]=None,
+                       include_total:bool=False, db:AsyncSession=Depends(get_async_db)):
+    """
+    The conversation's messages in the order they were written. With `limit` (or `after`) they are
+    keyset-paginated on message id: pass the X-Next-Cursor header of a page as `after`. Without them
+    the whole transcript is returned. X-Total-Count is only set with `include_total`.
+    """
     try:
         # Fetch the conversation by ID
         token=request.headers.get("Authorization")
         if not token:
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_data=verify_user(token)
+        user_data=await averify_user(token,db)
         emp_id,role=user_data["emp_id"],user_data["role"]
         if role != "employee":
             raise HTTPException(status_code=401, detail="Unauthorized access")
         
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-        print(conversation)
+        conversation = await db.get(Conversation, conversation_id)
 
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -251,14 +372,30 @@ def get_messages(conversation_id:str,request:Request,db:Session=Depends(get_db))
         if conversation.employee_id != emp_id:
             raise HTTPException(status_code=403, detail="Unauthorized access to this conversation")
 
-        # Fetch associated messages by their IDs
-        messages = db.query(Message).filter(Message.id.in_(conversation.message_ids)).all()
+        if limit is None and after is None:
+            # The whole transcript, as the chat routes see it (from the transcript cache)
+            rows = await aconversation_messages(db, conversation.id)
+            total = len(rows) if include_total else None
+        else:
+            messages = select(Message).where(Message.conversation_id == conversation.id)
+            if after is not None:
+                messages = messages.where(Message.id > after)
+            messages = messages.order_by(Message.id)
+            if limit is not None:
+                messages = messages.limit(limit + 1)
+            rows = (await db.execute(messages)).scalars().all()
+            total = None
+            if include_total:
+                total = (await db.execute(select(func.count(Message.id)).where(Message.conversation_id == conversation.id))).scalar()
+        page = set_page_headers(response, rows, limit, lambda msg: str(msg.id), total)
 
         # Format the response
-        message_list = [{"id": msg.id, "content": msg.content, "sender_type": msg.sender_type,"time":msg.time,"message_type":msg.message_type} for msg in messages]
+        message_list = [{"id": msg.id, "content": msg.content, "sender_type": msg.sender_type,"time":msg.time,"message_type":msg.message_type} for msg in page]
 
         return message_list
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -294,7 +431,7 @@ def fetch_todays_conv(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/insights/{conversation_id}")
-def get_insights(conversation_id: int, request:Request,db: Session = Depends(get_db)):
+async def get_insights(conversation_id: int, request:Request,db: AsyncSession = Depends(get_async_db)):
     """
     Generate insights based on the entire conversation using Gemini.
     """
@@ -303,12 +440,12 @@ def get_insights(conversation_id: int, request:Request,db: Session = Depends(get
         token=request.headers.get("Authorization")
         if not token:
             raise HTTPException(status_code=401, detail="Unauthorized")
-        user_data=verify_user(token)
+        user_data=await averify_user(token,db)
         emp_id,role=user_data["emp_id"],user_data["role"]
         if role != "employee":
             raise HTTPException(status_code=401, detail="Unauthorized access")
-        user=db.query(Master).filter(Master.employee_id == emp_id).first()
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        user=user_data["user"]
+        conversation = await db.get(Conversation, conversation_id)
 
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -317,16 +454,16 @@ def get_insights(conversation_id: int, request:Request,db: Session = Depends(get
             raise HTTPException(status_code=403, detail="Unauthorized access to this conversation")
 
         # 2. Fetch all messages associated with this conversation
-        messages = db.query(Message).filter(Message.id.in_(conversation.message_ids)).all()
+        messages = await aconversation_messages(db, conversation.id)
 
         if not messages:
             raise HTTPException(status_code=404, detail="No messages found for this conversation")
 
         # 3. Compile the conversation history
-        conversation_history = ""
-        for msg in messages:
-            role = "Employee" if msg.sender_type == "employee" else "Chatbot"
-            conversation_history += f"{role}: {msg.content}\n"
+        conversation_history = format_transcript(messages)
+        await arelease_connection(db)
+        # Shares its running summary with the report generated for this conversation afterwards
+        conversation_history = await compact_history(conversation_history, ("transcript", conversation.id), REPORT_HISTORY_TOKEN_BUDGET, wait=True)
 
         system_prompt = ("You are an empathetic and analytical assistant. Your task is to carefully analyze workplace conversations and generate thoughtful, structured insights. Focus on identifying mood, concerns, key issues, and offer actionable suggestions for improvement. Present your response clearly and professionally.")
         # 4. Create an insightful prompt for openai
@@ -339,43 +476,39 @@ def get_insights(conversation_id: int, request:Request,db: Session = Depends(get
             f"- Provide suggestions or recommendations to improve the situation.\n"
             f"- Format the insights in a clear and organized manner."
         )
-        # 5. Generate insights using Gemini
-        insights = chat_with_gpt4o(system_prompt, insight_prompt)
-
-        chatbot_message = Message(
-            content=insights,
-            sender_type="chatbot",
-            message_type="insight"
-        )
-        db.add(chatbot_message)
-        db.commit()
-        db.refresh(chatbot_message)
-
-        conversation.message_ids.append(chatbot_message.id)
-        db.commit()
-        db.refresh(conversation)
-
+        # 5. Generate insights
+        try:
+            insights = await complete("insights", system_prompt, insight_prompt)
+        except Exception as e:
+            print(f"Error generating insights: {str(e)}")
+            raise content_error(e)
+
+        # The completion flag is flushed in the same commit as the insight message
         user.conversation_completed=True
-        db.commit()
-        db.refresh(user)
+        await save_messages(db, conversation.id, (insights, "chatbot", "insight"))
+        await end_conversation(conversation.id)
 
         # 6. Return the insights
         return {
             "insights": insights
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating insights: {str(e)}")
+        print(f"Error generating insights: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error generating insights")
 
 @router.post("/test")
-def generate(request: PromptRequest):
+async def generate(request: PromptRequest):
     try:
-        response = generate_text(request.prompt)
+        response = await complete("test", "", request.prompt)
         return {"response": response}
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")   
+        print(f"Error: {str(e)}")
+        raise content_error(e)   
     
 
 @router.post("/transcribe")
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, BackgroundTasks
 from typing import List, Dict
 from sqlalchemy.orm import Session
 from sqlalchemy import inspect
 from database.conn import get_db
 from csv_ingest import ingest_csv_data, update_master_feature_vector,ingest_shap_values
 from database.models import Master,Conversation,Message, Vibemeter, ActivityTracker, Leave, Onboarding, Performance, Rewards
+from .message import refresh_user_summaries
 
 # Create a router instance
 router = APIRouter()
@@ -23,6 +24,7 @@ TABLE_MODELS = {
 
 @router.post("/ingest")
 async def ingest_data(
+    background_tasks: BackgroundTasks,
     table: str = "master",  # default to master if not provided
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
@@ -44,6 +46,9 @@ async def ingest_data(
     try:
         file_content = await file.read()
         count = ingest_csv_data(file_content, table, db)
+        if table == "master":
+            # shap_nature may have changed, so rebuild the cached user summaries off the request path
+            background_tasks.add_task(refresh_user_summaries)
         return {"message": f"Ingested {count} records into {table} table successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion error: {str(e)}")
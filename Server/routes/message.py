@@ -1,67 +1,99 @@
 from langchain_groq import ChatGroq
 from langchain.memory import ConversationBufferMemory
-import nltk
-from nltk.tokenize import word_tokenize
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.schema import Document
 import os
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 # from groq import Groq
-from langchain_huggingface import HuggingFaceEmbeddings
+from embedding_batcher import get_embedding_batcher
+from question_index import get_question_index
 from question_bank import question_bank
 import random
-from chatgpt import chat_with_gpt4o
+from llm_client import astream_chat
+from llm_router import complete, complete_with_usage
+from history_compactor import compact_history
+from conversation_state import get_conversation_state
+import metrics
+from dotenv import load_dotenv
+from database.conn import AsyncSessionLocal, arelease_connection
+from database.models import Master, UserSummary
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-# Download the required data file
-nltk.download('punkt_tab')
+load_dotenv()
 
-# # Tokenize each question separately and combine the results
-asked_questions = set()
+# How a chatbot turn is produced:
+#   "sequential"  - contradiction check, then the follow-up only if there was no contradiction
+#   "speculative" - both calls in parallel, the contradiction result decides which one is used
+#   "planner"     - one structured call decides the whole turn, falling back to "speculative" if its output is invalid
+CHAT_TURN_STRATEGY = os.getenv("CHAT_TURN_STRATEGY", "speculative").lower()
 
+# Decisions the planner may return for each incoming message_type
+PLANNER_ACTIONS = {
+    "normal_question": ("contradiction_follow_up", "follow_up"),
+    "followup_1": ("contradiction_follow_up", "follow_up"),
+}
+PLANNER_DEFAULT_ACTIONS = ("next_question",)
 
-# Pass questions_set
-def retrieve_relevant_questions(user_query, questions_set, top_k=20):
-    # print("System Prompt Applied:")
-    # print(system_prompt)
-    try:
-        # nltk.download('punkt_tab')
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2", encode_kwargs={"normalize_embeddings": True})
-        
+# The local next-question pick is used when it leads the runner-up by at least this cosine-similarity margin;
+# closer calls are sent to the LLM with up to NEXT_QUESTION_LLM_CANDIDATES of the top candidates
+NEXT_QUESTION_LLM_MARGIN = float(os.getenv("NEXT_QUESTION_LLM_MARGIN", "0.05"))
+NEXT_QUESTION_LLM_CANDIDATES = int(os.getenv("NEXT_QUESTION_LLM_CANDIDATES", "5"))
+# Lines of recent chat history embedded for the local selector
+NEXT_QUESTION_HISTORY_LINES = int(os.getenv("NEXT_QUESTION_HISTORY_LINES", "6"))
+
+# Max cosine-similarity gap between a prefetched next question and the best remaining question
+# (scored against the employee's new answer) for the prefetch to be accepted
+PREFETCH_MARGIN = float(os.getenv("PREFETCH_MARGIN", "0.1"))
+PREFETCH_MAX_CONVERSATIONS = int(os.getenv("PREFETCH_MAX_CONVERSATIONS", "1024"))
+# conversation_id -> task resolving to (candidate next question, tokens spent)
+_prefetched = OrderedDict()
+
+
+
+async def asked_questions_for(conversation_id):
+    """The questions already asked in the conversation. Read it once per turn and pass it down."""
+    return await get_conversation_state().asked_questions(conversation_id)
 
-        documents = []
-        for question in questions_set:
-            documents.extend(word_tokenize(question))
-        documents_as_docs = [Document(page_content=word) for word in documents]
 
-        vectorstore = FAISS.from_documents(documents_as_docs, embeddings)
-        vectorstore.save_local("vectorstore.db")
-        # retriever = vectorstore.as_retriever()
+def remaining_questions_for(question_set, asked):
+    """The conversation's planned questions that haven't been asked yet."""
+    return [q for q in question_set if q not in asked]
 
-        # Embed user query using embed_query to get a 1D embedding
-        query_embedding = embeddings.embed_query(user_query)
 
-        # Embed all questions using embed_query to get 1D embeddings for each question
-        question_embeddings = embeddings.embed_documents(documents)
+async def mark_asked(conversation_id, question):
+    await get_conversation_state().mark_asked(conversation_id, question)
 
-        # Compute similarity
-        similarities = cosine_similarity(
-            [query_embedding], question_embeddings)[0]
 
-        # Select top_k questions
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        top_questions = [questions_set[i] for i in top_indices]
+async def end_conversation(conversation_id):
+    """Drops everything kept for a conversation once it has completed."""
+    await get_conversation_state().clear(conversation_id)
+    _discard_prefetch(conversation_id)
 
-        return top_questions
+
+async def retrieve_relevant_questions(user_query, topics, top_k=20, query_embedding=None):
+    """Returns the top_k bank questions from the employee's SHAP topics, ranked against the query."""
+    index = get_question_index()
+    try:
+        if query_embedding is None:
+            query_embedding = await get_embedding_batcher().aembed_query(user_query)
+        return index.top_k(topics, query_embedding, top_k)
     except Exception as e:
         print(f"Error in retrieve_relevant_questions: {e}")
-        # Fallback to returning the first top_k questions
-        return questions_set[:top_k]
+        # Fallback to returning the first top_k questions of the employee's topics
+        return [index.questions[r] for r in index.topic_rows(topics)[:top_k]]
+
 
+async def retrieve_relevant_questions_batch(user_queries, topic_lists, top_k=20):
+    """Batch form of retrieve_relevant_questions for pre-planning many employees in one pass."""
+    query_embeddings = await get_embedding_batcher().aembed_documents(user_queries)
+    return get_question_index().top_k_batch(topic_lists, query_embeddings, top_k)
 
-def detect_contradiction(user_response, chat_history):
+
+async def detect_contradiction(user_response, chat_history):
     """Checks if the user response contradicts any previous responses."""
 
     if len(chat_history) < 2:
@@ -92,24 +124,23 @@ def detect_contradiction(user_response, chat_history):
         Do not explain or include any other text. Just return the follow-up question or 'None'.
         """
 
-        contradiction_question = chat_with_gpt4o(system_prompt, user_prompt)
+        contradiction_question = await complete("contradiction", system_prompt, user_prompt)
         return "" if contradiction_question.lower() == "none" else contradiction_question
     except Exception as e:
         print(f"Error in detect_contradiction: {e}")
         return ""
 
 
-def generate_follow_up(user_response):
-    """Generate 1 follow-up questions based on the user's response."""
-    try:
-        system_prompt = (
-            "You are a thoughtful assistant skilled in asking meaningful follow-up questions that deepen conversations. "
-            "Your job is to generate exactly ONE insightful follow-up question based on the user's latest response. "
-            "Return only the question—do not include any introductions, explanations, or additional text. "
-            "The question should encourage deeper thinking and explore a different angle from the user's previous response."
-        )
+def follow_up_prompts(user_response):
+    """Prompts for generating one follow-up question (shared by the plain and streaming paths)."""
+    system_prompt = (
+        "You are a thoughtful assistant skilled in asking meaningful follow-up questions that deepen conversations. "
+        "Your job is to generate exactly ONE insightful follow-up question based on the user's latest response. "
+        "Return only the question—do not include any introductions, explanations, or additional text. "
+        "The question should encourage deeper thinking and explore a different angle from the user's previous response."
+    )
 
-        user_prompt = f"""
+    user_prompt = f"""
         User's latest response:
         "{user_response}"
 
@@ -118,8 +149,14 @@ def generate_follow_up(user_response):
         - Do not repeat the user's wording exactly.
         - Do not add any commentary or explanation—just return the question as plain text.
         """
+    return system_prompt, user_prompt
+
 
-        follow_ups = chat_with_gpt4o(system_prompt, user_prompt)
+async def generate_follow_up(user_response):
+    """Generate 1 follow-up questions based on the user's response."""
+    try:
+        system_prompt, user_prompt = follow_up_prompts(user_response)
+        follow_ups = await complete("follow_up", system_prompt, user_prompt)
         return follow_ups.strip()  # Return the first follow-up question
         # return [q.strip() for q in follow_ups if q.strip()][:1]
     except Exception as e:
@@ -127,21 +164,24 @@ def generate_follow_up(user_response):
         return []
 
 
-def select_next_question(chat_history, question_set):
-    """Selects the next most relevant question that has NOT been asked."""
-    remaining_questions = [q for q in question_set if q not in asked_questions]
-
-    if not remaining_questions:
-        return None  # No more questions left
-
+async def stream_follow_up(user_response):
+    """Streaming form of generate_follow_up: yields the question in chunks as it is generated."""
+    system_prompt, user_prompt = follow_up_prompts(user_response)
+    tokens = astream_chat(system_prompt, user_prompt)
     try:
-
-        system_prompt = (
-            "You are an intelligent assistant that guides a conversation by selecting the most relevant next question from a given list. "
-            "You must consider the flow of the conversation and choose the most contextually appropriate question. "
-            "Return only the selected question as plain text. Do not include any explanation, commentary, or formatting."
-        )
-        user_prompt = f"""
+        async for token in tokens:
+            yield token
+    finally:
+        await tokens.aclose()
+
+
+def next_question_prompts(chat_history, remaining_questions):
+    system_prompt = (
+        "You are an intelligent assistant that guides a conversation by selecting the most relevant next question from a given list. "
+        "You must consider the flow of the conversation and choose the most contextually appropriate question. "
+        "Return only the selected question as plain text. Do not include any explanation, commentary, or formatting."
+    )
+    user_prompt = f"""
 Here is the conversation so far:
 {chat_history}
 
@@ -153,25 +193,232 @@ Instructions:
 - DO NOT include any explanation or extra text.
 - Return the question as plain text only.
 """
+    return system_prompt, user_prompt
 
-        next_question = chat_with_gpt4o(system_prompt, user_prompt)
 
-        if next_question in remaining_questions and next_question not in asked_questions:
-            asked_questions.add(next_question)
-            return next_question
-        else:
-            # Fallback: pick a random one to ensure progress
-            fallback = random.choice(remaining_questions)
-            asked_questions.add(fallback)
-            return fallback
+async def rank_remaining_questions(chat_history, remaining_questions):
+    """
+    Scores the remaining questions by embedding similarity to the recent chat history using the
+    precomputed question vectors. Returns [(question, score)] best first.
+    """
+    index = get_question_index()
+    questions = [q for q in remaining_questions if index.row_of(q) is not None]
+    if not questions:
+        return []
+    recent_history = "\n".join(str(chat_history).splitlines()[-NEXT_QUESTION_HISTORY_LINES:])
+    history_embedding = await get_embedding_batcher().aembed_query(recent_history)
+    scores = index.scores(history_embedding, [index.row_of(q) for q in questions])
+    order = np.argsort(-scores, kind="stable")
+    return [(questions[i], float(scores[i])) for i in order]
+
+
+async def choose_next_question(chat_history, remaining_questions):
+    """
+    Picks the next question without marking it as asked. The local ranking decides unless the
+    top candidates are within NEXT_QUESTION_LLM_MARGIN of each other, in which case the LLM chooses
+    among them. Returns (question, tokens spent).
+    """
+    ranked = await rank_remaining_questions(chat_history, remaining_questions)
+    if not ranked:
+        candidates = remaining_questions
+    elif len(ranked) == 1 or ranked[0][1] - ranked[1][1] >= NEXT_QUESTION_LLM_MARGIN:
+        metrics.incr("next_question.local")
+        return ranked[0][0], 0
+    else:
+        candidates = [q for q, score in ranked if ranked[0][1] - score < NEXT_QUESTION_LLM_MARGIN][:NEXT_QUESTION_LLM_CANDIDATES]
+
+    metrics.incr("next_question.llm")
+    system_prompt, user_prompt = next_question_prompts(chat_history, candidates)
+    next_question, tokens = await complete_with_usage("next_question", system_prompt, user_prompt)
+    if next_question in candidates:
+        return next_question, tokens
+    # Not an exact match: take the best local candidate rather than a random one
+    metrics.incr("next_question.llm_unmatched")
+    return candidates[0], tokens
+
+
+async def select_next_question(chat_history, question_set, conversation_id=None, user_response="", asked=None):
+    """Selects the next most relevant question that has NOT been asked. `asked` saves re-reading the turn's asked set."""
+    if asked is None:
+        asked = await asked_questions_for(conversation_id)
+    remaining_questions = remaining_questions_for(question_set, asked)
+
+    if not remaining_questions:
+        return None  # No more questions left
+
+    if conversation_id is not None:
+        prefetched = await take_prefetched_question(conversation_id, user_response, remaining_questions)
+        if prefetched is not None:
+            await mark_asked(conversation_id, prefetched)
+            return prefetched
+
+    try:
+        next_question, _ = await choose_next_question(chat_history, remaining_questions)
+        await mark_asked(conversation_id, next_question)
+        return next_question
     except Exception as e:
         print(f"Error in select_next_question: {e}")
         fallback = random.choice(remaining_questions)
-        asked_questions.add(fallback)
+        await mark_asked(conversation_id, fallback)
         return fallback
 
 
-def chatbot_conversation(shap_values, chat_history, user_response, message_type, question_set):
+def _discard_prefetch(conversation_id):
+    task = _prefetched.pop(conversation_id, None)
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled() and task.exception() is None:
+        metrics.incr("prefetch.wasted_tokens", task.result()[1])
+    metrics.incr("prefetch.discarded")
+
+
+async def _prefetch_next_question(conversation_id, chat_history, question_set):
+    remaining_questions = remaining_questions_for(question_set, await asked_questions_for(conversation_id))
+    if not remaining_questions:
+        return None, 0
+    chat_history = await compact_history(chat_history, conversation_id)
+    return await choose_next_question(chat_history, remaining_questions)
+
+
+def start_next_question_prefetch(conversation_id, chat_history, question_set):
+    """
+    Starts choosing the next bank question in the background as soon as a followup_2 reply
+    has been sent, while the employee is still typing. Must be called from the event loop.
+    """
+    _discard_prefetch(conversation_id)
+    _prefetched[conversation_id] = asyncio.create_task(_prefetch_next_question(conversation_id, chat_history, question_set))
+    while len(_prefetched) > PREFETCH_MAX_CONVERSATIONS:
+        _discard_prefetch(next(iter(_prefetched)))
+    metrics.incr("prefetch.started")
+
+
+async def _still_relevant(candidate, user_response, remaining_questions):
+    """The prefetched pick must score within PREFETCH_MARGIN of the best remaining question against the new answer."""
+    if not user_response.strip():
+        return True
+    index = get_question_index()
+    questions = [q for q in remaining_questions if index.row_of(q) is not None]
+    if candidate not in questions:
+        return True
+    answer_embedding = await get_embedding_batcher().aembed_query(user_response)
+    scores = index.scores(answer_embedding, [index.row_of(q) for q in questions])
+    return float(scores.max() - scores[questions.index(candidate)]) <= PREFETCH_MARGIN
+
+
+async def take_prefetched_question(conversation_id, user_response, remaining_questions):
+    """
+    Returns the prefetched next question if it is still valid after the employee's new answer,
+    otherwise None (the caller then selects synchronously).
+    """
+    task = _prefetched.pop(conversation_id, None)
+    if task is None:
+        metrics.incr("prefetch.absent")
+        return None
+    try:
+        # Usually already finished; if not, the request in flight is still cheaper than a new one
+        candidate, tokens = await task
+    except Exception as e:
+        print(f"Error in prefetched next question: {e}")
+        metrics.incr("prefetch.failed")
+        return None
+    if candidate is None:
+        # Nothing was left to ask when the prefetch ran
+        metrics.incr("prefetch.miss")
+        return None
+    if candidate in remaining_questions and await _still_relevant(candidate, user_response, remaining_questions):
+        metrics.incr("prefetch.hit")
+        return candidate
+    metrics.incr("prefetch.miss")
+    metrics.incr("prefetch.wasted_tokens", tokens)
+    return None
+
+
+def is_contradiction(contradiction_follow_up):
+    return contradiction_follow_up not in ("", None, "None.")
+
+
+async def speculative_follow_up(user_response, chat_history):
+    """
+    Issues the contradiction check and the follow-up generation concurrently.
+    Returns (contradiction_follow_up, follow_up_question); when a contradiction is found the
+    speculative follow-up is cancelled (or discarded if it already finished) and None is returned for it.
+    """
+    follow_up_task = asyncio.create_task(generate_follow_up(user_response))
+    try:
+        contradiction_follow_up = await detect_contradiction(user_response, chat_history)
+    except BaseException:
+        follow_up_task.cancel()
+        raise
+
+    if is_contradiction(contradiction_follow_up):
+        if follow_up_task.done():
+            metrics.incr("speculation.follow_up_discarded")
+        else:
+            follow_up_task.cancel()
+            metrics.incr("speculation.follow_up_cancelled")
+        metrics.incr("speculation.follow_up_wasted")
+        return contradiction_follow_up, None
+
+    metrics.incr("speculation.follow_up_used")
+    return contradiction_follow_up, await follow_up_task
+
+
+def _normalize_question(text):
+    return " ".join(str(text).strip().strip('"').split()).lower()
+
+
+async def plan_turn(chat_history, user_response, message_type, remaining_questions):
+    """
+    Decides the next chatbot message with a single structured completion.
+    Returns (question, action), or None when the output fails validation.
+    """
+    allowed_actions = PLANNER_ACTIONS.get(message_type, PLANNER_DEFAULT_ACTIONS)
+    if allowed_actions == PLANNER_DEFAULT_ACTIONS and not remaining_questions:
+        return None
+    try:
+        system_prompt = (
+            "You are an empathetic HR assistant planning the next message in a wellbeing check-in. "
+            "You decide the whole turn at once and reply with a single JSON object only."
+        )
+        user_prompt = f"""
+Conversation so far:
+{chat_history}
+
+Employee's latest message:
+"{user_response}"
+
+Allowed actions: {json.dumps(list(allowed_actions))}
+- "contradiction_follow_up": the latest message contradicts an earlier answer; ask ONE concise question that clarifies the contradiction.
+- "follow_up": no contradiction; ask ONE thoughtful question that digs deeper into the latest message without repeating its wording.
+- "next_question": choose the most relevant next question from the list below, copied exactly.
+
+Remaining questions:
+{json.dumps(remaining_questions, ensure_ascii=False)}
+
+Respond with JSON of the form {{"action": "<one of the allowed actions>", "question": "<the question to ask>"}} and nothing else.
+"""
+        decision = json.loads(await complete("planner", system_prompt, user_prompt, temperature=0.4, json_mode=True))
+        action = decision.get("action")
+        question = decision.get("question")
+        if action not in allowed_actions or not isinstance(question, str) or not question.strip():
+            raise ValueError(f"invalid decision {decision}")
+        if action == "next_question":
+            # Only questions from the plan are accepted, matched ignoring case and spacing
+            matches = {_normalize_question(q): q for q in remaining_questions}
+            question = matches.get(_normalize_question(question))
+            if question is None:
+                raise ValueError(f"question not in remaining list: {decision.get('question')}")
+        metrics.incr("planner.accepted")
+        return question.strip(), action
+    except Exception as e:
+        print(f"Error in plan_turn: {e}")
+        metrics.incr("planner.fallback")
+        return None
+
+
+async def chatbot_conversation(shap_values, chat_history, user_response, message_type, question_set, conversation_id=None):
     """Handles the chatbot conversation logic."""
 
     try:
@@ -180,30 +427,53 @@ def chatbot_conversation(shap_values, chat_history, user_response, message_type,
             current_shap_questions = question_bank[first_shap_value].get(
                 "questions", [])
             current_question = random.choice(current_shap_questions)
-            asked_questions.add(current_question)
+            await mark_asked(conversation_id, current_question)
             return current_question, "normal_question"
 
+        # Every prompt below sees the recent messages verbatim and a running summary of the rest
+        chat_history = await compact_history(chat_history, conversation_id)
+
+        # The turn's asked set is read at most once and shared with select_next_question
+        asked = None
+        if CHAT_TURN_STRATEGY == "planner":
+            asked = await asked_questions_for(conversation_id)
+            remaining_questions = remaining_questions_for(question_set, asked)
+            if message_type not in PLANNER_ACTIONS and conversation_id is not None and remaining_questions:
+                prefetched = await take_prefetched_question(conversation_id, user_response, remaining_questions)
+                if prefetched is not None:
+                    await mark_asked(conversation_id, prefetched)
+                    return prefetched, "normal_question"
+            planned = await plan_turn(chat_history, user_response, message_type, remaining_questions)
+            if planned is not None:
+                question, action = planned
+                if action != "follow_up":
+                    await mark_asked(conversation_id, question)
+                if message_type == "normal_question":
+                    return question, "followup_1"
+                if message_type == "followup_1":
+                    return question, "followup_2"
+                return question, "normal_question"
+
         if message_type == "followup_1" or message_type == "normal_question":
             print(f"User Response1: {user_response}")
-            contradiction_follow_up = detect_contradiction(
-                user_response, chat_history)
-
-            if contradiction_follow_up != "" and contradiction_follow_up != None and contradiction_follow_up != "None.":
-                asked_questions.add(contradiction_follow_up)
-                if message_type == "normal_question":
-                    return contradiction_follow_up, "followup_1"
-                elif message_type == "followup_1":
-                    return contradiction_follow_up, "followup_2"
+            follow_up_question = None
+            if CHAT_TURN_STRATEGY in ("speculative", "planner"):
+                contradiction_follow_up, follow_up_question = await speculative_follow_up(
+                    user_response, chat_history)
             else:
-                print(f"User Response2: {user_response}")
-                follow_up_question = generate_follow_up(user_response)
-                if message_type == "normal_question":
-                    return follow_up_question, "followup_1"
-                elif message_type == "followup_1":
-                    return follow_up_question, "followup_2"
-
-        next_question = select_next_question(chat_history, question_set)
-        asked_questions.add(next_question)
+                contradiction_follow_up = await detect_contradiction(
+                    user_response, chat_history)
+
+            next_message_type = "followup_1" if message_type == "normal_question" else "followup_2"
+            if is_contradiction(contradiction_follow_up):
+                await mark_asked(conversation_id, contradiction_follow_up)
+                return contradiction_follow_up, next_message_type
+            print(f"User Response2: {user_response}")
+            if follow_up_question is None:
+                follow_up_question = await generate_follow_up(user_response)
+            return follow_up_question, next_message_type
+
+        next_question = await select_next_question(chat_history, question_set, conversation_id, user_response, asked)
         # chat_history.append(AIMessage(content=next_question))
         return next_question, "normal_question"
     except Exception as e:
@@ -211,6 +481,98 @@ def chatbot_conversation(shap_values, chat_history, user_response, message_type,
         return "I'm sorry, I couldn't process your request.Please try again", "normal_question"
 
 
+async def speculative_stream_follow_up(user_response, chat_history):
+    """
+    Streaming form of speculative_follow_up. The follow-up stream starts immediately and is buffered
+    while the contradiction check runs. Returns (contradiction_follow_up, tokens) where tokens is an
+    async iterator over the follow-up, or None when a contradiction was found.
+    """
+    buffer = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for token in stream_follow_up(user_response):
+                await buffer.put(token)
+            await buffer.put(done)
+        except Exception as e:
+            await buffer.put(e)
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        contradiction_follow_up = await detect_contradiction(user_response, chat_history)
+    except BaseException:
+        pump_task.cancel()
+        raise
+
+    if is_contradiction(contradiction_follow_up):
+        if pump_task.done():
+            metrics.incr("speculation.follow_up_discarded")
+        else:
+            pump_task.cancel()
+            metrics.incr("speculation.follow_up_cancelled")
+        metrics.incr("speculation.follow_up_wasted")
+        return contradiction_follow_up, None
+
+    metrics.incr("speculation.follow_up_used")
+
+    async def drain():
+        try:
+            while True:
+                item = await buffer.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The consumer went away (e.g. the client disconnected): stop the upstream request
+            pump_task.cancel()
+
+    return contradiction_follow_up, drain()
+
+
+async def stream_chatbot_conversation(shap_values, chat_history, user_response, message_type, question_set, conversation_id=None):
+    """
+    Streaming form of chatbot_conversation. Yields ("token", text) events while the reply is produced
+    and ends with one ("done", (message, message_type)) event. Only free-text follow-ups are streamed
+    token by token; bank questions and clarifications arrive as a single chunk.
+    """
+    if CHAT_TURN_STRATEGY != "planner" and message_type in ("normal_question", "followup_1"):
+        next_message_type = "followup_1" if message_type == "normal_question" else "followup_2"
+        try:
+            chat_history = await compact_history(chat_history, conversation_id)
+            if CHAT_TURN_STRATEGY == "speculative":
+                contradiction_follow_up, tokens = await speculative_stream_follow_up(user_response, chat_history)
+            else:
+                contradiction_follow_up = await detect_contradiction(user_response, chat_history)
+                tokens = None if is_contradiction(contradiction_follow_up) else stream_follow_up(user_response)
+        except Exception as e:
+            print(f"Error in stream_chatbot_conversation: {e}")
+            contradiction_follow_up, tokens = "I'm sorry, I couldn't process your request.Please try again", None
+
+        if tokens is None:
+            await mark_asked(conversation_id, contradiction_follow_up)
+            yield "token", contradiction_follow_up
+            yield "done", (contradiction_follow_up, next_message_type)
+            return
+
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield "token", token
+        finally:
+            # Closing the token stream aborts the upstream request if we stopped early
+            await tokens.aclose()
+        yield "done", ("".join(parts).strip(), next_message_type)
+        return
+
+    message, next_message_type = await chatbot_conversation(shap_values, chat_history, user_response, message_type, question_set, conversation_id)
+    yield "token", message
+    yield "done", (message, next_message_type)
+
+
 # Run the chatbot
 # chatbot_conversation()
   # Import SystemMessage and HumanMessage
@@ -236,7 +598,7 @@ def chatbot_conversation(shap_values, chat_history, user_response, message_type,
 #         content=f"Employee details: {input_str}"
 #     )
 # ]
-def generate_user_summary(input_data):
+async def generate_user_summary(input_data):
     """Generates a summary based on the user's input data."""
     # Convert input dict to readable string
     input_str = ", ".join([f"{k}: {v}" for k, v in input_data.items()])
@@ -245,5 +607,83 @@ def generate_user_summary(input_data):
 
     system_prompt = "You are an HR assistant AI. Given an employee's data (like promotion, holidays, work hours, mood), generate a short and professional summary (2-3 sentences) that reflects their work experience, satisfaction, and potential concerns. This gives a description with a focus on the problems of the employee"
     user_prompt = f"Employee details: {input_str}"
-    summary = chat_with_gpt4o(system_prompt, user_prompt)
+    summary = await complete("summary", system_prompt, user_prompt)
     return summary
+
+
+def shap_nature_fingerprint(shap_nature):
+    """Stable hash of an employee's shap_nature, used to tell when the cached summary is stale."""
+    payload = json.dumps(shap_nature or {}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _save_summary(employee_id, shap_nature, summary, embedding):
+    """Upsert of an employee's cached summary (concurrent first turns may both write it)."""
+    values = {
+        "summary": summary,
+        "fingerprint": shap_nature_fingerprint(shap_nature),
+        "embedding": [float(x) for x in embedding],
+        "updated_at": datetime.now(),
+    }
+    return pg_insert(UserSummary).values(employee_id=employee_id, **values)\
+        .on_conflict_do_update(index_elements=[UserSummary.employee_id], set_=values)
+
+
+async def get_cached_user_summary(user, db):
+    """
+    Returns (summary, embedding) for the employee, calling the LLM only when shap_nature
+    has changed since the cached summary was generated. `db` is the request's AsyncSession;
+    no connection is held during the LLM call.
+    """
+    cached = await db.get(UserSummary, user.employee_id)
+    if cached is not None and cached.fingerprint == shap_nature_fingerprint(user.shap_nature):
+        return cached.summary, cached.embedding
+
+    await arelease_connection(db)
+    summary = await generate_user_summary(user.shap_nature or {})
+    embedding = await get_embedding_batcher().aembed_query(summary)
+    await db.execute(_save_summary(user.employee_id, user.shap_nature, summary, embedding))
+    await db.commit()
+    return summary, [float(x) for x in embedding]
+
+
+async def refresh_user_summaries():
+    """
+    Regenerates the cached summary of every employee whose shap_nature changed.
+    Meant to run in the background right after a master table ingest. Uses the async engine and
+    holds no connection during the LLM calls; an employee whose summary fails keeps the old one.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(Master.employee_id, Master.shap_nature, Master.shap_values, UserSummary.fingerprint)
+                .outerjoin(UserSummary, UserSummary.employee_id == Master.employee_id)
+            )).all()
+        stale = [
+            (row.employee_id, row.shap_nature or {}) for row in rows
+            if row.shap_values and row.fingerprint != shap_nature_fingerprint(row.shap_nature)
+        ]
+        if not stale:
+            return 0
+        # Summaries are generated concurrently, bounded by the LLM client's semaphore
+        results = await asyncio.gather(*[generate_user_summary(shap_nature) for _, shap_nature in stale], return_exceptions=True)
+        done = []
+        for (employee_id, shap_nature), result in zip(stale, results):
+            if isinstance(result, Exception):
+                print(f"Error summarizing employee {employee_id}: {result}")
+                metrics.incr("user_summary.failed")
+            else:
+                done.append((employee_id, shap_nature, result))
+        if not done:
+            return 0
+        # One batched forward pass for all new summaries
+        embeddings = await get_embedding_batcher().aembed_documents([summary for _, _, summary in done])
+        async with AsyncSessionLocal() as db:
+            for (employee_id, shap_nature, summary), embedding in zip(done, embeddings):
+                await db.execute(_save_summary(employee_id, shap_nature, summary, embedding))
+            await db.commit()
+        print(f"Refreshed {len(done)} of {len(stale)} user summaries")
+        return len(done)
+    except Exception as e:
+        print(f"Error in refresh_user_summaries: {e}")
+        return 0
@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+import metrics
+from embeddings import get_embedding_service
+from greetings import get_greeting_engine
+from llm_router import get_llm_router
+import resilience
+from conversation_state import get_conversation_state
+from database.conn import pool_stats
+from transcript_cache import get_transcript_cache
+
+router = APIRouter()
+
+
+@router.get("")
+def get_metrics():
+    """
+    Returns the in-process counters and latency timers for this worker.
+    """
+    return {
+        "embeddings": get_embedding_service().stats(),
+        "greetings": get_greeting_engine().stats(),
+        "llm_providers": get_llm_router().stats(),
+        "circuits": resilience.stats(),
+        "conversation_state": get_conversation_state().stats(),
+        "transcripts": get_transcript_cache().stats(),
+        "db_pool": pool_stats(),
+        **metrics.snapshot(),
+    }
@@ -2,6 +2,7 @@
 
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from jinja2 import Environment, FileSystemLoader
 from xhtml2pdf import pisa
@@ -9,14 +10,17 @@ from io import BytesIO
 from datetime import datetime
 from pydantic import BaseModel
 from typing import Dict
-from database.conn import get_db
-from database.models import Conversation, Message, Master, Vibemeter, Leave, Performance, Rewards, ActivityTracker,HRUser
+from database.conn import get_db, release_connection
+from database.models import Conversation, Master, Vibemeter, Leave, Performance, Rewards, ActivityTracker,HRUser
 from .auth import verify_user
 from transformers import pipeline
 from aws_uploader import upload_pdf_to_s3
-import os
 import json
-from openai import AsyncOpenAI
+from llm_router import complete
+from history_compactor import REPORT_HISTORY_TOKEN_BUDGET, compact_history
+from transcript_cache import conversation_messages, role_of
+from resilience import CircuitOpenError, retry_after_of, status_code_of
+import math
 from datetime import datetime
 import concurrent.futures
 import asyncio
@@ -157,31 +161,28 @@ def analyze_emotions(messages):
 
 
 
-# Set up OpenAI API key
-client=AsyncOpenAI()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # Replace with your actual API key or use environment variables
+def content_error(e):
+    """Maps a provider failure (already retried by the resilience layer) to the HTTP error we return."""
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail="Content generation is temporarily unavailable",
+                             headers={"Retry-After": str(math.ceil(e.retry_after))})
+    if status_code_of(e) == 429:
+        retry_after = retry_after_of(e)
+        return HTTPException(status_code=503, detail="Content generation is rate limited, please retry shortly",
+                             headers={"Retry-After": str(math.ceil(retry_after))} if retry_after is not None else None)
+    if isinstance(e, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)) or type(e).__name__ == "APITimeoutError":
+        return HTTPException(status_code=504, detail="Timed out generating content")
+    return HTTPException(status_code=502, detail="Error generating content")
 
-# Function to make API calls to OpenAI
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 
+# Function to make API calls to OpenAI through the shared pooled client
 async def generate_content(system_prompt, user_prompt, model="gpt-4o", temperature=0.4):
     try:
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=temperature,
-            max_tokens=1500,
-        )
-        # Extract the text from the response
-        # print(response)
-        return response.choices[0].message.content.strip()
+        return await complete("report", system_prompt, user_prompt, model=model, temperature=temperature, max_tokens=1500)
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error generating content")
+        raise content_error(e)
     
     
 async def generate_personal_details_section(employee_data={}, vibe_data={}, leave_data={}, performance_data={}, rewards_data={}, activity_data={}):
@@ -361,14 +362,18 @@ async def generate_root_cause_analysis(conversation_transcript,shap_data, datase
 
 async def generate_complete_employee_report(employee_id,conversation_id,db=next(get_db())):
     # 1. Load all necessary data for this employee
-    employee_data = load_employee_data(employee_id)
-    vibe_data = load_vibe_data(employee_id)
-    leave_data = load_leave_data(employee_id)
-    performance_data = load_performance_data(employee_id)
-    rewards_data = load_rewards_data(employee_id)
-    activity_data = load_activity_data(employee_id)
-    conversation_data,severity_score,escalate = load_conversation_data(employee_id,conversation_id)
-    shap_data = load_shap_data(employee_id)
+    employee_data = load_employee_data(employee_id, db)
+    vibe_data = load_vibe_data(employee_id, db)
+    leave_data = load_leave_data(employee_id, db)
+    performance_data = load_performance_data(employee_id, db)
+    rewards_data = load_rewards_data(employee_id, db)
+    activity_data = load_activity_data(employee_id, db)
+    conversation_data,severity_score,escalate = load_conversation_data(employee_id,conversation_id, db)
+    shap_data = load_shap_data(employee_id, db)
+    # Everything is loaded: don't hold a pooled connection through the LLM calls below
+    release_connection(db)
+    # One compacted transcript (recent messages plus a summary of the rest) shared by all three transcript prompts
+    conversation_transcript = await compact_history(conversation_data, ("transcript", int(conversation_id)), REPORT_HISTORY_TOKEN_BUDGET, wait=True)
 
     
 
@@ -401,9 +406,9 @@ async def generate_complete_employee_report(employee_id,conversation_id,db=next(
 
     tasks=[ asyncio.create_task(generate_personal_details_section(employee_data, vibe_data, leave_data, performance_data, rewards_data, activity_data)),
         asyncio.create_task(generate_pre_conversation_analysis(shap_data['feature_dict'], shap_data['dataset_mapping'])),
-            asyncio.create_task(generate_conversation_summary(conversation_data)),
-            asyncio.create_task(generate_sentiment_analysis(conversation_data, severity_score)),
-            asyncio.create_task(generate_root_cause_analysis(conversation_data,shap_data['feature_dict'], shap_data['dataset_mapping']))
+            asyncio.create_task(generate_conversation_summary(conversation_transcript)),
+            asyncio.create_task(generate_sentiment_analysis(conversation_transcript, severity_score)),
+            asyncio.create_task(generate_root_cause_analysis(conversation_transcript,shap_data['feature_dict'], shap_data['dataset_mapping']))
     ]
     # loop=asyncio.get_event_loop()
     results=await asyncio.gather(*tasks)
@@ -595,19 +600,13 @@ def load_conversation_data(employee_id,conversation_id, db=next(get_db())):
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    if not conversation.message_ids:
+    # The messages in the order they were written (shared with the chat routes' transcript cache)
+    messages = conversation_messages(db, conversation.id)
+    if not messages:
         raise HTTPException(status_code=404, detail="No messages found for this conversation")
 
-    # Fetch and sort messages
-    messages = db.query(Message).filter(Message.id.in_(conversation.message_ids)).all()
-    # print(messages)
-    # messages.sort(key=lambda m: m.id)
-
     # Build conversation history
-    conversation_history = [
-        {"role": "Chatbot" if msg.sender_type.lower() == "chatbot" else "Employee", "content": msg.content}
-        for msg in messages
-    ]
+    conversation_history = [{"role": role_of(msg), "content": msg.content} for msg in messages]
     severity_score, escalate = analyze_emotions(messages)
     user.is_Flagged=escalate
     user.sentimental_score=severity_score
@@ -653,6 +652,8 @@ async def get_employee_report(request: Request,db: Session = Depends(get_db)):
         # Generate the report
         # print(employee_id,conversation_id)
         report = await generate_complete_employee_report(emp_id,conversation_id,db)
+        # PDF rendering and the S3 upload are slow too
+        release_connection(db)
 
         # return {"report":report}
 
@@ -682,9 +683,11 @@ async def get_employee_report(request: Request,db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Conversation not found")
         conversation.report = s3_url
         db.commit()
-        db.refresh()
 
         return {"message": "PDF report uploaded successfully", "pdf_url": s3_url}
+    except HTTPException:
+        db.rollback()
+        raise
     except:
         db.rollback()
         raise HTTPException(status_code=500, detail="Error generating employee report")
@@ -745,22 +748,13 @@ async def generate_report_content(report_data):
     Write a professional executive summary for this.
     """
 
-    response = await client.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "system", "content": "You are an HR analytics expert."},
-                  {"role": "user", "content": prompt}]
-    )
-
-    return response.choices[0].message.content.strip()
-
-@router.post("/daily")
-def daily_report(db: Session = Depends(get_db)):
-    report_data = get_daily_report()
-    report_content = generate_report_content(report_data)
+    return await complete("report", "You are an HR analytics expert.", prompt, model="gpt-4")
 
+def render_pdf(template_name, **context):
+    """Renders a report template to PDF bytes. Blocking: async routes call it via run_in_threadpool."""
     env = Environment(loader=FileSystemLoader("templates"))
-    template = env.get_template("report_template_daily.html")
-    html_content = template.render(report_data=report_data, report_content=report_content)
+    template = env.get_template(template_name)
+    html_content = template.render(**context)
 
     pdf_file = BytesIO()
     pisa_status = pisa.CreatePDF(html_content, dest=pdf_file)
@@ -768,15 +762,12 @@ def daily_report(db: Session = Depends(get_db)):
     if pisa_status.err:
         raise HTTPException(status_code=500, detail="Error generating PDF with xhtml2pdf")
 
-    pdf_file.seek(0)  # Reset the buffer pointer
     pdf_bytes = pdf_file.getvalue()
+    pdf_file.close()
+    return pdf_bytes
 
-    # S3 Upload
-    filename = f"report_daily_{datetime.now().strftime('%Y-%m-%d')}.pdf"
-    s3_url = upload_pdf_to_s3(pdf_bytes, filename)
 
-    # Close PDF buffer
-    pdf_file.close()
+def save_daily_report_url(db, s3_url):
     #get the first data from hrusers
     user=db.query(HRUser).first()
     if not user:
@@ -784,6 +775,22 @@ def daily_report(db: Session = Depends(get_db)):
     user.daily_report = s3_url
     db.commit()
 
+
+@router.post("/daily")
+async def daily_report(db: Session = Depends(get_db)):
+    # The DB queries, PDF rendering and S3 upload are blocking, so they run in the threadpool;
+    # only the LLM call is awaited on the event loop
+    report_data = await run_in_threadpool(get_daily_report, db)  # Closes the session, so no connection is held during the LLM call
+    report_content = await generate_report_content(report_data)
+
+    pdf_bytes = await run_in_threadpool(render_pdf, "report_template_daily.html", report_data=report_data, report_content=report_content)
+
+    # S3 Upload
+    filename = f"report_daily_{datetime.now().strftime('%Y-%m-%d')}.pdf"
+    s3_url = await run_in_threadpool(upload_pdf_to_s3, pdf_bytes, filename)
+
+    await run_in_threadpool(save_daily_report_url, db, s3_url)
+
     return {"message": "PDF report uploaded successfully", "pdf_url": s3_url}
 
 
@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+import llm_router
+from llm_router import LLMRouter, Provider
+
+
+class FakeProvider(Provider):
+    """Local stand-in for exercising routing, hedging and failover without network calls."""
+
+    def __init__(self, name, reply="Fake reply", latency_s=0.0, fail=False, supports_json=True):
+        self.name = name
+        self.reply = reply
+        self.latency_s = latency_s
+        self.fail = fail
+        self.supports_json = supports_json
+        self.calls = 0
+        self.cancelled = 0
+
+    async def complete(self, system_prompt, user_prompt, **options):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency_s)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        return self.reply, 7
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_hedges_to_next_provider_after_threshold():
+    slow, fast = FakeProvider("slow", "slow", latency_s=1.0), FakeProvider("fast", "fast", latency_s=0.01)
+    router = LLMRouter([slow, fast], {"default": {"providers": ["slow", "fast"], "hedge_after_ms": 50}})
+
+    assert run(router.complete_with_usage("default", "", "hi")) == ("fast", 7)
+    assert fast.calls == 1
+    # The losing request is cancelled, and a lost race doesn't count against the provider's health
+    assert slow.cancelled == 1
+    assert len(router.health["slow"].outcomes) == 0
+
+
+def test_no_hedge_when_first_provider_answers_in_time():
+    first, second = FakeProvider("first", "first", latency_s=0.01), FakeProvider("second", "second")
+    router = LLMRouter([first, second], {"default": {"providers": ["first", "second"], "hedge_after_ms": 500}})
+
+    assert run(router.complete("default", "", "hi")) == "first"
+    assert second.calls == 0
+
+
+def test_fails_over_on_error():
+    broken, fast = FakeProvider("broken", fail=True), FakeProvider("fast", "fast")
+    router = LLMRouter([broken, fast], {"default": {"providers": ["broken", "fast"]}})
+
+    assert run(router.complete("default", "", "hi")) == "fast"
+    assert broken.calls == 1
+    assert list(router.health["broken"].outcomes) == [False]
+
+
+def test_raises_last_error_when_every_provider_fails():
+    router = LLMRouter([FakeProvider("a", fail=True), FakeProvider("b", fail=True)], {"default": {"providers": ["a", "b"]}})
+
+    with pytest.raises(RuntimeError, match="b unavailable"):
+        run(router.complete("default", "", "hi"))
+
+
+def test_unhealthy_provider_moves_to_the_back():
+    broken, fast = FakeProvider("broken", fail=True), FakeProvider("fast", "fast")
+    router = LLMRouter([broken, fast], {"default": {"providers": ["broken", "fast"]}})
+    assert [p.name for p in router.candidates("default")] == ["broken", "fast"]
+
+    for _ in range(llm_router.HEALTH_MIN_SAMPLES):
+        run(router.complete("default", "", "hi"))
+
+    assert not router.health["broken"].healthy()
+    assert [p.name for p in router.candidates("default")] == ["fast", "broken"]
+    calls = broken.calls
+    assert run(router.complete("default", "", "hi")) == "fast"
+    assert broken.calls == calls
+
+
+def test_json_mode_skips_providers_without_json_support():
+    plain, structured = FakeProvider("plain", supports_json=False), FakeProvider("structured", "{}")
+    router = LLMRouter([plain, structured], {"default": {"providers": ["plain", "structured"]}})
+
+    assert [p.name for p in router.candidates("default", json_mode=True)] == ["structured"]
+    assert run(router.complete("default", "", "hi", json_mode=True)) == "{}"
+    assert plain.calls == 0
+
+
+def test_json_mode_without_capable_provider_raises():
+    router = LLMRouter([FakeProvider("plain", supports_json=False)], {"default": {"providers": ["plain"]}})
+
+    with pytest.raises(RuntimeError, match="No LLM provider"):
+        run(router.complete("site", "", "hi", json_mode=True))
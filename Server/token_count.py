@@ -0,0 +1,12 @@
+import re
+
+# Words and individual punctuation marks; close to BPE token counts for English chat text
+# and far cheaper than running a real tokenizer on every prompt
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """Fast estimate of the number of tokens in `text`."""
+    if not text:
+        return 0
+    return len(_TOKEN_PATTERN.findall(text))
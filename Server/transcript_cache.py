@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from dotenv import load_dotenv
+from sqlalchemy import select
+import metrics
+from database.models import Message
+
+load_dotenv()
+
+# Conversations whose transcript is kept in memory
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "1024"))
+# Another worker may have written to a conversation since it was cached, so a hit also reads the messages
+# past the last one seen in the DB (one index range scan on (conversation_id, id)). Only turn it off ("0")
+# when a single worker process serves every conversation.
+TRANSCRIPT_CACHE_TAIL_READS = os.getenv("TRANSCRIPT_CACHE_TAIL_READS", "1") == "1"
+
+CachedMessage = namedtuple("CachedMessage", ["id", "content", "sender_type", "message_type", "time"])
+
+
+def _cached(row):
+    return CachedMessage(row.id, row.content, row.sender_type, row.message_type, row.time)
+
+
+def role_of(message):
+    return "Chatbot" if message.sender_type.lower() in ("chatbot", "assistant") else "Employee"
+
+
+def format_transcript(messages):
+    """The "Role: content" history text used in prompts."""
+    return "\n".join(f"{role_of(msg)}: {msg.content}" for msg in messages)
+
+
+class _Transcript:
+    """
+    A cached conversation. `read_up_to` is the highest id read from the DB: messages appended by this
+    process may be newer, but ids are shared by every conversation and worker, so a message another
+    worker wrote between the two would be skipped if tail reads started after the appended ones.
+    """
+
+    def __init__(self, messages, read_up_to):
+        self.messages = messages
+        self.read_up_to = read_up_to
+
+
+def _merge_by_id(*groups):
+    merged = {msg.id: msg for group in groups for msg in group}
+    return tuple(merged[message_id] for message_id in sorted(merged))
+
+
+class TranscriptCache:
+    """
+    Ordered messages per conversation in an LRU. A miss loads the conversation from the DB once;
+    save_messages appends each committed turn, and with tail_reads every hit also reads what was
+    written after the last message read from the DB, so turns stored by other workers aren't missed.
+    """
+
+    def __init__(self, max_conversations=TRANSCRIPT_CACHE_SIZE, tail_reads=TRANSCRIPT_CACHE_TAIL_READS):
+        self.max_conversations = max_conversations
+        self.tail_reads = tail_reads
+        self._entries = OrderedDict()  # conversation_id -> _Transcript
+        self._writes = 0  # bumped on every append, so a load racing a write isn't cached
+        self._lock = threading.Lock()
+
+    def _store(self, conversation_id, entry):
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+            metrics.incr("transcripts.evicted")
+
+    def _lookup(self, conversation_id):
+        """Returns (cached entry or None, write counter, query for what must still be read or None)."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                self._entries.move_to_end(conversation_id)
+            writes = self._writes
+        if entry is not None and not self.tail_reads:
+            metrics.incr("transcripts.hits")
+            return entry, writes, None
+
+        query = select(Message).where(Message.conversation_id == conversation_id)
+        if entry is not None:
+            metrics.incr("transcripts.tail_reads")
+            query = query.where(Message.id > entry.read_up_to)
+        else:
+            metrics.incr("transcripts.misses")
+        return entry, writes, query.order_by(Message.id)
+
+    def _merge(self, conversation_id, entry, writes, rows):
+        rows = tuple(_cached(row) for row in rows)
+        if entry is None:
+            with self._lock:
+                if self._writes == writes:
+                    self._store(conversation_id, _Transcript(rows, rows[-1].id if rows else 0))
+            return rows
+        if not rows:
+            return entry.messages
+        with self._lock:
+            # The entry may have been appended to meanwhile; the tail read can overlap what was appended
+            current = self._entries.get(conversation_id, entry)
+            messages = _merge_by_id(current.messages, rows)
+            if self._entries.get(conversation_id) is not None:
+                self._store(conversation_id, _Transcript(messages, max(current.read_up_to, rows[-1].id)))
+        return messages
+
+    def messages(self, db, conversation_id):
+        """The conversation's messages in the order they were written."""
+        entry, writes, query = self._lookup(conversation_id)
+        if query is None:
+            return entry.messages
+        return self._merge(conversation_id, entry, writes, db.execute(query).scalars().all())
+
+    async def amessages(self, db, conversation_id):
+        """messages() with an AsyncSession."""
+        entry, writes, query = self._lookup(conversation_id)
+        if query is None:
+            return entry.messages
+        return self._merge(conversation_id, entry, writes, (await db.execute(query)).scalars().all())
+
+    def append(self, conversation_id, messages):
+        """Adds committed messages to a cached transcript (a conversation not cached is loaded on its next read)."""
+        with self._lock:
+            self._writes += 1
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            self._store(conversation_id, _Transcript(_merge_by_id(entry.messages, messages), entry.read_up_to))
+
+    def stats(self):
+        return {"conversations": len(self._entries), "tail_reads": self.tail_reads}
+
+
+transcript_cache = TranscriptCache()
+
+
+def get_transcript_cache():
+    return transcript_cache
+
+
+def conversation_messages(db, conversation_id):
+    return transcript_cache.messages(db, conversation_id)
+
+
+async def aconversation_messages(db, conversation_id):
+    return await transcript_cache.amessages(db, conversation_id)
+
+
+async def aconversation_transcript(db, conversation_id):
+    return format_transcript(await aconversation_messages(db, conversation_id))
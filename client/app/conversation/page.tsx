@@ -41,7 +41,6 @@ export default function ConversationPage() {
       ? localStorage.getItem("conversation_id")
       : null
   );
-  const [selectedQuestions, setSelectedQuestions] = useState<string[]>([]);
 
   const [maxQuestions, setMaxQuestions] = useState(TotalQuestions);
 
@@ -341,12 +340,6 @@ export default function ConversationPage() {
 
   const handleSendMessage = async () => {
     setIsLoading(true);
-    const chat_history = messages.map((msg) => {
-      return {
-        sender_type: msg.isUser ? "employee" : "chatbot",
-        message: msg.content,
-      };
-    });
     if (inputValue.trim()) {
       const userMessage: Message = {
         id: `user-${Date.now()}`,
@@ -372,7 +365,6 @@ export default function ConversationPage() {
         // console.log("employee_name:", employee_name);
         // console.log("employee_name:", employee_id);
         // console.log("Conversation_id:", conversationId);
-        // console.log("Chat history:", chat_history);
         // console.log("Selected Questions:", selectedQuestions);
         // console.log("Message_type:", message_type);
         // console.log("Input Value:", inputValue);
@@ -389,8 +381,7 @@ export default function ConversationPage() {
               conversationId || localStorage.getItem("conversation_id"),
             // last message type,
             message_type: message_type,
-            chat_history: chat_history,
-            question_set: selectedQuestions,
+            // The server rebuilds the chat history from the stored messages
           },
           {
             headers: {
@@ -404,7 +395,6 @@ export default function ConversationPage() {
 
         chatbot_response = data.chatbot_response;
         setIsTyping({ isActive: false });
-        setSelectedQuestions(data.question_set);
         setMessageType(data.message_type);
         if (data.message_type === "normal_question") {
           setMaxQuestions((prev) => prev - 1);